@@ -3,83 +3,104 @@ import re
 from django.http import HttpResponse, HttpResponseRedirect
 
 from mapit.shortcuts import get_object_or_404
+from mapit.transform import transform_points
 
-def area_code_lookup(area_id, format):
-    from mapit.models import Area, CodeType
-    area_code = None
-    if re.match('\d\d([A-Z]{2}|[A-Z]{4}|[A-Z]{2}\d\d\d|[A-Z]|[A-Z]\d\d)$', area_id):
-        area_code = CodeType.objects.get(code='ons')
-    if re.match('[ENSW]\d{8}$', area_id):
-        area_code = CodeType.objects.get(code='gss')
-    if not area_code:
-        return None
-    area = get_object_or_404(Area, format=format, codes__type=area_code, codes__code=area_id)
-    if isinstance(area, HttpResponse): return area
-    return HttpResponseRedirect('/area/%d%s' % (area.id, '.%s' % format if format else ''))
+ONS_CODE_MATCH = re.compile('\d\d([A-Z]{2}|[A-Z]{4}|[A-Z]{2}\d\d\d|[A-Z]|[A-Z]\d\d)$').match
+GSS_CODE_MATCH = re.compile('[ENSW]\d{8}$').match
 
-def is_special_postcode(pc):
-    if pc in (
-        'ASCN1ZZ', # Ascension Island
-        'BBND1ZZ', # BIOT
-        'BIQQ1ZZ', # British Antarctic Territory
-        'FIQQ1ZZ', # Falkland Islands
-        'PCRN1ZZ', # Pitcairn Islands
-        'SIQQ1ZZ', # South Georgia and the South Sandwich Islands
-        'STHL1ZZ', # St Helena
-        'TDCU1ZZ', # Tristan da Cunha
-        'TKCA1ZZ', # Turks and Caicos Islands
-        'GIR0AA', 'G1R0AA', # Girobank
-        'SANTA1', # Santa Claus
-    ):
-        return True
-    return False
+def area_code_lookup(area_id, format, inline=False):
+    """If area_id is an ONS or GSS code, returns a redirect to the area with
+    that code (or if inline, just its ID) or a 404 if there isn't one.
+    Returns None if area_id isn't a code."""
+    from mapit.models import Area, Code, CodeType
+    code_type = None
+    if ONS_CODE_MATCH(area_id):
+        code_type = 'ons'
+    if GSS_CODE_MATCH(area_id):
+        code_type = 'gss'
+    if not code_type:
+        return None
+    id = Code.objects.area_id(code_type, area_id)
+    if id is None:
+        # Not in the current generation
+        area = get_object_or_404(Area, format=format, codes__type=CodeType.objects.get_cached(code_type), codes__code=area_id)
+        if isinstance(area, HttpResponse): return area
+        id = area.id
+    if inline: return id
+    return HttpResponseRedirect('/area/%d%s' % (id, '.%s' % format if format else ''))
 
-def is_valid_postcode(pc):
-    # Our test postcode
-    if pc in ('ZZ99ZZ', 'ZZ99ZY'): return True
+SPECIAL_POSTCODES = frozenset((
+    'ASCN1ZZ', # Ascension Island
+    'BBND1ZZ', # BIOT
+    'BIQQ1ZZ', # British Antarctic Territory
+    'FIQQ1ZZ', # Falkland Islands
+    'PCRN1ZZ', # Pitcairn Islands
+    'SIQQ1ZZ', # South Georgia and the South Sandwich Islands
+    'STHL1ZZ', # St Helena
+    'TDCU1ZZ', # Tristan da Cunha
+    'TKCA1ZZ', # Turks and Caicos Islands
+    'GIR0AA', 'G1R0AA', # Girobank
+    'SANTA1', # Santa Claus
+))
 
-    if is_special_postcode(pc): return True
+# Our test postcodes
+TEST_POSTCODES = frozenset(( 'ZZ99ZZ', 'ZZ99ZY' ))
+TEST_PARTIAL_POSTCODES = frozenset(( 'ZZ9', ))
 
-    # See http://www.govtalk.gov.uk/gdsc/html/noframes/PostCode-2-1-Release.htm
-    inward = 'ABDEFGHJLNPQRSTUWXYZ'
-    fst = 'ABCDEFGHIJKLMNOPRSTUWYZ'
-    sec = 'ABCDEFGHJKLMNOPQRSTUVWXY'
-    thd = 'ABCDEFGHJKSTUW'
-    fth = 'ABEHMNPRVWXY'
+# See http://www.govtalk.gov.uk/gdsc/html/noframes/PostCode-2-1-Release.htm
+# The six forms of outward code, each then followed by the inward code in a
+# full postcode. These are compiled once into one pattern for each.
+_fst = '[ABCDEFGHIJKLMNOPRSTUWYZ]'
+_sec = '[ABCDEFGHJKLMNOPQRSTUVWXY]'
+_thd = '[ABCDEFGHJKSTUW]'
+_fth = '[ABEHMNPRVWXY]'
+_inward = '[ABDEFGHJLNPQRSTUWXYZ]'
+_outward = '(?:%s)' % '|'.join([
+    _fst + '[1-9]',
+    _fst + '[1-9]\d',
+    _fst + _sec + '\d',
+    _fst + _sec + '[1-9]\d',
+    _fst + '[1-9]' + _thd,
+    _fst + _sec + '[1-9]' + _fth,
+])
+POSTCODE_MATCH = re.compile(_outward + '\d' + _inward + _inward + '$').match
+PARTIAL_POSTCODE_MATCH = re.compile(_outward + '$').match
 
-    if re.match('[%s][1-9]\d[%s][%s]$' % (fst, inward, inward), pc) or \
-        re.match('[%s][1-9]\d\d[%s][%s]$' % (fst, inward, inward), pc) or \
-        re.match('[%s][%s]\d\d[%s][%s]$' % (fst, sec, inward, inward), pc) or \
-        re.match('[%s][%s][1-9]\d\d[%s][%s]$' % (fst, sec, inward, inward), pc) or \
-        re.match('[%s][1-9][%s]\d[%s][%s]$' % (fst, thd, inward, inward), pc) or \
-        re.match('[%s][%s][1-9][%s]\d[%s][%s]$' % (fst, sec, fth, inward, inward), pc):
-        return True
+def is_special_postcode(pc):
+    return pc in SPECIAL_POSTCODES
 
-    return False
+def is_valid_postcode(pc):
+    if pc in TEST_POSTCODES or pc in SPECIAL_POSTCODES: return True
+    return POSTCODE_MATCH(pc) is not None
 
 def is_valid_partial_postcode(pc):
-    # Our test postcode
-    if pc == 'ZZ9': return True
-    
-    # See http://www.govtalk.gov.uk/gdsc/html/noframes/PostCode-2-1-Release.htm
-    fst = 'ABCDEFGHIJKLMNOPRSTUWYZ'
-    sec = 'ABCDEFGHJKLMNOPQRSTUVWXY'
-    thd = 'ABCDEFGHJKSTUW'
-    fth = 'ABEHMNPRVWXY'
-  
-    if re.match('[%s][1-9]$' % (fst), pc) or \
-        re.match('[%s][1-9]\d$' % (fst), pc) or \
-        re.match('[%s][%s]\d$' % (fst, sec), pc) or \
-        re.match('[%s][%s][1-9]\d$' % (fst, sec), pc) or \
-        re.match('[%s][1-9][%s]$' % (fst, thd), pc) or \
-        re.match('[%s][%s][1-9][%s]$' % (fst, sec, fth), pc):
-        return True
+    if pc in TEST_PARTIAL_POSTCODES: return True
+    return PARTIAL_POSTCODE_MATCH(pc) is not None
 
-    return False
+def validate_many(postcodes):
+    """Returns a list of whether each of the given (upper case, space free)
+    postcodes is valid, as is_valid_postcode would."""
+    match = POSTCODE_MATCH
+    special = TEST_POSTCODES | SPECIAL_POSTCODES
+    return [ pc in special or match(pc) is not None for pc in postcodes ]
 
 def get_postcode_display(pc):
     return re.sub('(...)$', r' \1', pc).strip()
 
+def prepare_postcodes(postcodes):
+    """Works out the grid references augment_postcode will need for many
+    postcodes at once."""
+    from mapit.models import Postcode
+    postcodes = [ pc for pc in postcodes if pc.location and not is_special_postcode(pc.postcode) ]
+    Postcode.objects.add_irish_grid([ pc for pc in postcodes if pc.postcode[0:2] == 'BT' ])
+    gb = [ pc for pc in postcodes if pc.postcode[0:2] != 'BT' ]
+    if gb:
+        grid = transform_points([ pc.location.coords for pc in gb ], gb[0].location.srid, 27700, database=False)
+        for pc, loc in zip(gb, grid):
+            pc.national_grid = loc
+
+# The national grid reference has always come from GDAL's own definition of
+# 27700, so is still made with that, rather than the database's
 def augment_postcode(postcode, result):
     pc = postcode.postcode
     if is_special_postcode(pc): return
@@ -87,9 +108,9 @@ def augment_postcode(postcode, result):
         loc = postcode.as_irish_grid()
         result['coordsyst'] = 'I'
     else:
-        loc = postcode.location
-        loc.transform(27700)
+        loc = getattr(postcode, 'national_grid', None)
+        if loc is None:
+            loc = transform_points([ postcode.location.coords ], postcode.location.srid, 27700, database=False)[0]
         result['coordsyst'] = 'G'
     result['easting'] = int(round(loc[0]))
     result['northing'] = int(round(loc[1]))
-
@@ -5,14 +5,17 @@ area_geometry_srid = 32633
 
 # Norwegian postcodes are four digits. Some put "no-" in front, but
 # this is ignored here.
+POSTCODE_MATCH = re.compile('\d{4}$').match
+PARTIAL_POSTCODE_MATCH = re.compile('\d{1,3}$').match
+
 def is_valid_postcode(pc):
-    if re.match('\d{4}$', pc):
-        return True
-    return False
+    return POSTCODE_MATCH(pc) is not None
 
 # Should match one, two and three digits.
 def is_valid_partial_postcode(pc):
-    if re.match('\d{1,3}$', pc):
-        return True
-    return False
+    return PARTIAL_POSTCODE_MATCH(pc) is not None
+
+def validate_many(postcodes):
+    match = POSTCODE_MATCH
+    return [ match(pc) is not None for pc in postcodes ]
 
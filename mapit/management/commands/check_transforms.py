@@ -0,0 +1,48 @@
+# This script checks that transforming postcode locations in process, with
+# the database's definitions (see mapit.transform), gives the same results as
+# ST_Transform, to within a millimetre (or its equivalent in degrees). Give
+# the SRIDs to transform to; it defaults to the grids MapIt transforms to. Run
+# it after upgrading GDAL or PostGIS, or correcting spatial_ref_sys.
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from mapit.models import Postcode
+from mapit.transform import compare_with_database
+
+# How far apart the results may be, in metres or degrees
+TOLERANCE = 0.001
+TOLERANCE_DEGREES = 0.00000001
+
+class Command(BaseCommand):
+    help = 'Check in-process coordinate transformations against PostGIS'
+    args = '[SRID ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--count', action='store', type='int', dest='count', default=1000, help='How many postcodes to try (default 1000)'),
+    )
+
+    def handle(self, *srids, **options):
+        if srids:
+            srids = [ int(srid) for srid in srids ]
+        elif settings.MAPIT_COUNTRY == 'GB':
+            srids = [ 27700, 29902 ]
+        else:
+            srids = [ settings.MAPIT_AREA_SRID ]
+
+        postcodes = list(Postcode.objects.filter(location__isnull=False).order_by('?')[:options['count']])
+        if not postcodes:
+            raise Exception, "No postcodes to check with"
+        points = [ pc.location.coords for pc in postcodes ]
+        from_srid = postcodes[0].location.srid
+
+        failed = False
+        for srid in srids:
+            if srid == from_srid: continue
+            error = compare_with_database(points, from_srid, srid)
+            tolerance = TOLERANCE_DEGREES if srid == 4326 else TOLERANCE
+            ok = error <= tolerance
+            print "%d to %d: largest difference %g over %d points%s" % (
+                from_srid, srid, error, len(points), '' if ok else ' - TOO LARGE')
+            failed = failed or not ok
+        if failed:
+            raise Exception, "In-process transformations don't match the database"
@@ -0,0 +1,110 @@
+# This script is used after boundaries have been imported for a generation,
+# to work out which areas every area touches, overlaps, covers and is covered
+# by, and store that so those lookups needn't be done live; which areas have
+# had their relations found is stored too, so that an area with none isn't
+# looked up live either, and a change to any area's polygons forgets those of
+# its generations until this is run again. Each batch of
+# areas is one spatial join against all the other areas in the generation,
+# working out each pair's intersection matrix once; with --processes, the
+# batches are shared out between a pool of processes. Run it before
+# generation_activate.
+
+import re
+from itertools import imap
+from multiprocessing import Pool
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+from mapit.models import Area, Generation, RELATION_PATTERNS, relation_regex
+from utils import CopyFile
+
+AREAS_PER_BATCH = 100
+
+RELATIONS = [ (relation, re.compile(relation_regex([ relation ]))) for relation in RELATION_PATTERNS ]
+
+class Command(NoArgsCommand):
+    help = 'Store how areas relate to each other for a generation'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--generation_id', action='store', dest='generation_id', help='Which generation to use (defaults to the new inactive one)'),
+        make_option('--processes', action='store', dest='processes', type='int', default=1, help='Share the work between a pool of this many processes'),
+        make_option('--commit', action='store_true', dest='commit', help='Actually update the database'),
+    )
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        if options['generation_id']:
+            generation = Generation.objects.get(id=options['generation_id'])
+        else:
+            generation = Generation.objects.new()
+            if not generation:
+                raise Exception, "No new generation to be used for import!"
+
+        area_ids = list(Area.objects.filter(
+            generation_low__lte=generation, generation_high__gte=generation,
+            polygons__isnull=False,
+        ).order_by().distinct().values_list('id', flat=True))
+        batches = [ (generation.id, area_ids[i:i+AREAS_PER_BATCH]) for i in range(0, len(area_ids), AREAS_PER_BATCH) ]
+
+        pool = None
+        if options['processes'] > 1:
+            # Don't let the workers share our database connection
+            connection.close()
+            pool = Pool(options['processes'])
+            results = pool.imap_unordered(find_relations, batches)
+        else:
+            results = imap(find_relations, batches)
+
+        # Everything is found before anything is written, as the COPY can't
+        # share a connection with the lookups
+        rows = []
+        for i, batch in enumerate(results):
+            rows.extend(batch)
+            print "Done %d of %d batches of areas..." % (i + 1, len(batches))
+        if pool:
+            pool.close()
+            pool.join()
+
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM mapit_arearelation WHERE generation_id = %s', [ generation.id ])
+        cursor.copy_from(
+            CopyFile( '%d\t%d\t%s\t%d\n' % (row + (generation.id,)) for row in rows ),
+            'mapit_arearelation', columns=('area_id', 'related_area_id', 'relation', 'generation_id')
+        )
+        # Note whose relations have been found, so that areas without any
+        # aren't looked up live
+        cursor.execute('DELETE FROM mapit_arearelationsfound WHERE generation_id = %s', [ generation.id ])
+        if area_ids:
+            cursor.execute('''
+                INSERT INTO mapit_arearelationsfound (area_id, generation_id, found)
+                SELECT unnest(%s), %s, now()
+            ''', [ area_ids, generation.id ])
+
+        if options['commit']:
+            transaction.commit()
+            print "%s - stored %d relations between %d areas" % (generation, len(rows), len(area_ids))
+        else:
+            transaction.rollback()
+            print "%s - found %d relations between %d areas, dry run" % (generation, len(rows), len(area_ids))
+
+def find_relations(args):
+    """Returns the set of (area ID, related area ID, relation) rows for a
+    batch of areas in a generation, with one query. This is a function rather
+    than a method so that a pool of processes can run it."""
+    generation, area_ids = args
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT DISTINCT target.id, mapit_area.id, ST_Relate(mapit_geometry.polygon, target.polygon)
+        FROM (
+            SELECT area_id AS id, ST_Collect(polygon) AS polygon
+            FROM mapit_geometry WHERE area_id IN %s GROUP BY area_id
+        ) AS target, mapit_geometry, mapit_area
+        WHERE mapit_geometry.polygon && target.polygon
+            AND mapit_area.id = mapit_geometry.area_id AND mapit_area.id != target.id
+            AND mapit_area.generation_low_id <= %s AND mapit_area.generation_high_id >= %s
+    ''', [ tuple(area_ids), generation, generation ])
+    rows = set()
+    for area_id, related_id, matrix in cursor.fetchall():
+        for relation, regex in RELATIONS:
+            if regex.match(matrix):
+                rows.add( (area_id, related_id, relation) )
+    return rows
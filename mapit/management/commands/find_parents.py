@@ -2,13 +2,17 @@
 # associate shapes with their parents. With the new coding
 # system coming in, this could be done from a BIG lookup table; however,
 # I reckon P-in-P tests might be quick enough...
+# Each type of child is done with one spatial join in the database, and the
+# changes written back with one UPDATE.
 
 from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
 from mapit.models import Area, Generation
 
 class Command(NoArgsCommand):
     help = 'Find parents for shapes'
 
+    @transaction.commit_on_success
     def handle_noargs(self, **options):
         new_generation = Generation.objects.new()
         if not new_generation:
@@ -26,28 +30,58 @@ class Command(NoArgsCommand):
             'WAC': 'WAE',
             'CPC': ('DIS', 'UTA', 'MTD', 'LBO', 'COI'),
         }
-        for area in Area.objects.filter(
-            type__code__in=parentmap.keys(),
-            generation_low__lte=new_generation, generation_high__gte=new_generation,
-        ):
-            polygon = area.polygons.all()[0]
-            try:
-                args = {
-                    'polygons__polygon__contains': polygon.polygon.point_on_surface,
-                    'generation_low__lte': new_generation,
-                    'generation_high__gte': new_generation,
-                }
-                if isinstance(parentmap[area.type.code], str):
-                    args['type__code'] = parentmap[area.type.code]
-                else:
-                    args['type__code__in'] = parentmap[area.type.code]
-                parent = Area.objects.get(**args)
-            except Area.DoesNotExist:
-                raise Exception, "Area %s does not have a parent?" % (self.pp_area(area))
-            if area.parent_area != parent:
-                print "Parent for %s was %s, is now %s" % (self.pp_area(area), self.pp_area(area.parent_area), self.pp_area(parent))
-                area.parent_area = parent
-                area.save()
+        for child_type, parent_types in parentmap.items():
+            if isinstance(parent_types, str):
+                parent_types = ( parent_types, )
+            parent_ids = self.find_parents(child_type, parent_types, new_generation)
+            parents = Area.objects.select_related('type').in_bulk(set(parent_ids.values()))
+
+            changes = []
+            for area in Area.objects.filter(
+                type__code=child_type,
+                generation_low__lte=new_generation, generation_high__gte=new_generation,
+            ).select_related('type', 'parent_area', 'parent_area__type'):
+                if area.id not in parent_ids:
+                    raise Exception, "Area %s does not have a parent?" % (self.pp_area(area))
+                parent = parents[parent_ids[area.id]]
+                if area.parent_area_id != parent.id:
+                    print "Parent for %s was %s, is now %s" % (self.pp_area(area), self.pp_area(area.parent_area), self.pp_area(parent))
+                    changes.append( (area.id, parent.id) )
+
+            if changes:
+                cursor = connection.cursor()
+                cursor.execute(
+                    'UPDATE mapit_area SET parent_area_id = changes.parent_id FROM (VALUES %s) AS changes (id, parent_id) WHERE mapit_area.id = changes.id'
+                        % ', '.join([ '(%s, %s)' ] * len(changes)),
+                    [ id for change in changes for id in change ]
+                )
+
+    def find_parents(self, child_type, parent_types, generation):
+        """Returns a dictionary mapping the ID of every area of child_type in
+        generation to the ID of the area of one of parent_types containing a
+        point on its (first) polygon's surface."""
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT child.id, parent.id
+            FROM (
+                SELECT DISTINCT ON (mapit_area.id) mapit_area.id, ST_PointOnSurface(mapit_geometry.polygon) AS point
+                FROM mapit_area, mapit_type, mapit_geometry
+                WHERE mapit_type.id = mapit_area.type_id AND mapit_type.code = %s
+                    AND mapit_area.generation_low_id <= %s AND mapit_area.generation_high_id >= %s
+                    AND mapit_geometry.area_id = mapit_area.id
+                ORDER BY mapit_area.id, mapit_geometry.id
+            ) AS child, mapit_geometry AS parent_geometry, mapit_area AS parent, mapit_type AS parent_type
+            WHERE ST_Contains(parent_geometry.polygon, child.point)
+                AND parent.id = parent_geometry.area_id
+                AND parent_type.id = parent.type_id AND parent_type.code IN %s
+                AND parent.generation_low_id <= %s AND parent.generation_high_id >= %s
+        ''', [ child_type, generation.id, generation.id, tuple(parent_types), generation.id, generation.id ])
+        parents = {}
+        for child_id, parent_id in cursor.fetchall():
+            if parents.get(child_id, parent_id) != parent_id:
+                raise Exception, "Area %d has more than one parent?" % child_id
+            parents[child_id] = parent_id
+        return parents
 
     def pp_area(self, area):
         if not area: return "None"
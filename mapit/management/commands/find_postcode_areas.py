@@ -0,0 +1,52 @@
+# This script is used after postcodes and boundaries have been imported for a
+# generation, to work out which areas every postcode is in with one big
+# spatial join, and store that so postcode lookups needn't do it each time.
+# Run it after find_parents and the postcode imports, before
+# generation_activate; and again if postcodes are reimported into a
+# generation afterwards.
+
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.conf import settings
+from django.db import connection, transaction
+from mapit.models import Generation
+
+class Command(NoArgsCommand):
+    help = 'Store which areas each postcode is in for a generation'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--generation_id', action='store', dest='generation_id', help='Which generation to use (defaults to the new inactive one)'),
+        make_option('--commit', action='store_true', dest='commit', help='Actually update the database'),
+    )
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        if options['generation_id']:
+            generation = Generation.objects.get(id=options['generation_id'])
+        else:
+            generation = Generation.objects.new()
+            if not generation:
+                raise Exception, "No new generation to be used for import!"
+
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM mapit_postcodearea WHERE generation_id = %s', [ generation.id ])
+        cursor.execute('''
+            INSERT INTO mapit_postcodearea (generation_id, postcode_id, area_id)
+            SELECT DISTINCT %%s, mapit_postcode.id, mapit_area.id
+            FROM mapit_postcode, mapit_geometry, mapit_area
+            WHERE ST_Contains(mapit_geometry.polygon, ST_Transform(mapit_postcode.location, %d))
+                AND mapit_area.id = mapit_geometry.area_id
+                AND mapit_area.generation_low_id <= %%s AND mapit_area.generation_high_id >= %%s
+            UNION
+            SELECT %%s, mapit_postcode_areas.postcode_id, mapit_area.id
+            FROM mapit_postcode_areas, mapit_area
+            WHERE mapit_area.id = mapit_postcode_areas.area_id
+                AND mapit_area.generation_low_id <= %%s AND mapit_area.generation_high_id >= %%s
+        ''' % settings.MAPIT_AREA_SRID, [ generation.id ] * 6)
+        count = cursor.rowcount
+
+        if options['commit']:
+            transaction.commit()
+            print "%s - stored %d postcode areas" % (generation, count)
+        else:
+            transaction.rollback()
+            print "%s - found %d postcode areas, dry run" % (generation, count)
@@ -0,0 +1,57 @@
+# This script fills the tile cache with the vector tiles of the current
+# generation's areas of the given types, so that the first person to look at
+# a map needn't wait for them. Run it after generation_activate.
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connection
+from mapit.models import Generation
+from mapit.tiles import TILE_SRID, MAX_ZOOM, tile_range, get_tile
+
+class Command(BaseCommand):
+    help = 'Generate vector tiles of the areas of the given types'
+    args = '<type code> [type code ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--min_zoom', action='store', type='int', dest='min_zoom', default=0, help='The lowest zoom level to generate (default 0)'),
+        make_option('--max_zoom', action='store', type='int', dest='max_zoom', default=10, help='The highest zoom level to generate (default 10)'),
+    )
+
+    def handle(self, *types, **options):
+        if not types:
+            raise Exception, "Please specify at least one area type"
+        if options['max_zoom'] > MAX_ZOOM:
+            raise Exception, "Tiles are only served up to zoom level %d" % MAX_ZOOM
+        generation = Generation.objects.current()
+        if not generation:
+            raise Exception, "No current generation to generate tiles for!"
+
+        for type in types:
+            extent = self.extent(type, generation)
+            if not extent:
+                print "No areas of type %s" % type
+                continue
+            for z in range(options['min_zoom'], options['max_zoom'] + 1):
+                xs, ys = tile_range(z, extent)
+                for x in xs:
+                    for y in ys:
+                        get_tile(type, generation, z, x, y)
+                print "%s - generated %d tiles at zoom %d" % (type, len(xs) * len(ys), z)
+
+    def extent(self, type, generation):
+        """Returns the extent of the areas of type in generation, in
+        TILE_SRID, or None if there are none."""
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT ST_XMin(box), ST_YMin(box), ST_XMax(box), ST_YMax(box)
+            FROM (SELECT ST_Transform(ST_SetSRID(ST_Extent(mapit_geometry.polygon)::geometry, %d), %d) AS box
+                FROM mapit_area, mapit_type, mapit_geometry
+                WHERE mapit_type.id = mapit_area.type_id AND mapit_type.code = %%s
+                    AND mapit_area.generation_low_id <= %%s AND mapit_area.generation_high_id >= %%s
+                    AND mapit_geometry.area_id = mapit_area.id
+            ) AS extent
+        ''' % (settings.MAPIT_AREA_SRID, TILE_SRID), [ type, generation.id, generation.id ])
+        extent = cursor.fetchone()
+        if extent[0] is None:
+            return None
+        return extent
@@ -17,7 +17,7 @@ class Command(NoArgsCommand):
 
         new.active = True
         if options['commit']:
-            new.save()
+            new.save() # This also tells running processes to look again
             print "%s - activated" % new
         else:
             print "%s - not activated, dry run" % new
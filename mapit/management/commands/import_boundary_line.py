@@ -5,8 +5,10 @@
 
 import re
 import sys
+from multiprocessing import Pool
 from optparse import make_option
 from django.core.management.base import LabelCommand
+from django.db import connection
 # Not using LayerMapping as want more control, but what it does is what this does
 #from django.contrib.gis.utils import LayerMapping
 from django.contrib.gis.gdal import *
@@ -19,10 +21,20 @@ class Command(LabelCommand):
     option_list = LabelCommand.option_list + (
         make_option('--control', action='store', dest='control', help='Refer to a Python module that can tell us what has changed'),
         make_option('--commit', action='store_true', dest='commit', help='Actually update the database'),
+        make_option('--processes', action='store', dest='processes', type='int', default=1, help='Look up the features of each file using a pool of this many processes'),
     )
 
     ons_code_to_shape = {}
     unit_id_to_shape = {}
+    pool = None
+
+    def handle(self, *labels, **options):
+        try:
+            return super(Command, self).handle(*labels, **options)
+        finally:
+            if self.pool:
+                self.pool.close()
+                self.pool.join()
 
     def handle_label(self,  filename, **options):
         if not options['control']:
@@ -42,20 +54,18 @@ class Command(LabelCommand):
 
         ds = DataSource(filename)
         layer = ds[0]
-        for feat in layer:
-            name = unicode(feat['NAME'].value, 'iso-8859-1')
 
-            name = re.sub('\s*\(DET( NO \d+|)\)\s*(?i)', '', name)
-            name = re.sub('\s+', ' ', name)
+        # The parsing and look ups can be done in parallel, as long as the
+        # results are then stored in order. Each file is finished before the
+        # next is started, so e.g. WMC can still find wards imported earlier.
+        looked_up = None
+        if options['processes'] > 1:
+            looked_up = self.parallel_lookup(filename, len(layer), options)
 
-            ons_code = feat['CODE'].value if feat['CODE'].value not in ('999999', '999999999') else None
-            unit_id = str(feat['UNIT_ID'].value)
-            area_code = feat['AREA_CODE'].value
-            patch = self.patch_boundary_line(ons_code, area_code)
-            if patch == True: ons_code = None
-            elif patch: ons_code = patch
-            
-            if area_code == 'NCP': continue # Ignore Non Parished Areas
+        for i, feat in enumerate(layer):
+            parsed = self.parse_feature(feat)
+            if not parsed: continue
+            name, ons_code, unit_id, area_code = parsed
 
             if ons_code in self.ons_code_to_shape:
                 m, poly = self.ons_code_to_shape[ons_code]
@@ -78,42 +88,13 @@ class Command(LabelCommand):
                 poly.append(feat.geom)
                 continue
 
-            if code_version.code == 'gss' and ons_code:
-                country = ons_code[0] # Hooray!
-            elif area_code in ('CED', 'CTY', 'DIW', 'DIS', 'MTW', 'MTD', 'LBW', 'LBO', 'LAC', 'GLA'):
-                country = 'E'
-            elif code_version.code == 'gss':
-                raise Exception, area_code
-            elif (area_code == 'EUR' and 'Scotland' in name) or area_code in ('SPC', 'SPE') or (ons_code and ons_code[0:3] in ('00Q', '00R')):
-                country = 'S'
-            elif (area_code == 'EUR' and 'Wales' in name) or area_code in ('WAC', 'WAE') or (ons_code and ons_code[0:3] in ('00N', '00P')):
-                country = 'W'
-            elif area_code in ('EUR', 'UTA', 'UTE', 'UTW', 'CPC'):
-                country = 'E'
-            else: # WMC
-                # Make sure WMC are loaded after all wards...
-                area_within = Area.objects.filter(type__code__in=('UTW','UTE','MTW','COP','LBW','DIW'), polygons__polygon__contains=feat.geom.geos.point_on_surface)[0]
-                country = area_within.country.code
-            # Can't do the above ons_code checks with new GSS codes, will have to do more PinP checks
-            # Do parents in separate P-in-P code after this is done.
-
-            try:
-                check = control.check(name, area_code, country, feat.geom)
-                if check == True:
-                    raise Area.DoesNotExist
-                if isinstance(check, Area):
-                    m = check
-                    ons_code = m.codes.get(type=code_version)
-                elif ons_code:
-                    m = Area.objects.get(codes__type=code_version, codes__code=ons_code)
-                elif unit_id:
-                    m = Area.objects.get(codes__type=code_type_os, codes__code=unit_id)
-                    m_name = m.names.get(type=name_type).name
-                    if name != m_name:
-                        raise Exception, "Unit ID code %s is %s in DB but %s in SHP file" % (unit_id, m_name, name)
-                else:
-                    raise Exception, 'Area "%s" (%s) has neither ONS code nor unit ID' % (name, area_code)
-            except Area.DoesNotExist:
+            if looked_up:
+                error, country, m, ons_code = looked_up[i]
+                if error: raise error
+            else:
+                country, m, ons_code = self.lookup_feature(parsed, feat.geom, control, code_version, code_type_os, name_type)
+
+            if m is None:
                 print "New area: %s %s %s %s" % (area_code, ons_code, unit_id, name)
                 m = Area(
                     name = name, # If committing, this will be overwritten by the m.names.update_or_create
@@ -146,6 +127,85 @@ class Command(LabelCommand):
             save_polygons(self.unit_id_to_shape)
             save_polygons(self.ons_code_to_shape)
 
+    def parallel_lookup(self, filename, count, options):
+        """Runs parse_feature and lookup_feature over all the features of a
+        file in a pool of processes, returning the results in feature order."""
+        if not self.pool:
+            # Don't let the workers share our database connection
+            connection.close()
+            self.pool = Pool(options['processes'])
+        size = max(1, count // (options['processes'] * 4))
+        chunks = self.pool.map(lookup_features, [
+            (filename, start, min(start + size, count), options['control'])
+            for start in range(0, count, size)
+        ])
+        return [ result for chunk in chunks for result in chunk ]
+
+    def parse_feature(self, feat):
+        """Returns the cleaned up name, ONS code, unit ID and area type of a
+        feature, or None if it is to be ignored."""
+        name = unicode(feat['NAME'].value, 'iso-8859-1')
+
+        name = re.sub('\s*\(DET( NO \d+|)\)\s*(?i)', '', name)
+        name = re.sub('\s+', ' ', name)
+
+        ons_code = feat['CODE'].value if feat['CODE'].value not in ('999999', '999999999') else None
+        unit_id = str(feat['UNIT_ID'].value)
+        area_code = feat['AREA_CODE'].value
+        patch = self.patch_boundary_line(ons_code, area_code)
+        if patch == True: ons_code = None
+        elif patch: ons_code = patch
+        
+        if area_code == 'NCP': return None # Ignore Non Parished Areas
+
+        return name, ons_code, unit_id, area_code
+
+    def lookup_feature(self, parsed, geom, control, code_version, code_type_os, name_type):
+        """Works out the country of a feature and finds its existing area.
+        Returns the country, the Area (or None if it is new), and the ONS code
+        to use."""
+        name, ons_code, unit_id, area_code = parsed
+
+        if code_version.code == 'gss' and ons_code:
+            country = ons_code[0] # Hooray!
+        elif area_code in ('CED', 'CTY', 'DIW', 'DIS', 'MTW', 'MTD', 'LBW', 'LBO', 'LAC', 'GLA'):
+            country = 'E'
+        elif code_version.code == 'gss':
+            raise Exception, area_code
+        elif (area_code == 'EUR' and 'Scotland' in name) or area_code in ('SPC', 'SPE') or (ons_code and ons_code[0:3] in ('00Q', '00R')):
+            country = 'S'
+        elif (area_code == 'EUR' and 'Wales' in name) or area_code in ('WAC', 'WAE') or (ons_code and ons_code[0:3] in ('00N', '00P')):
+            country = 'W'
+        elif area_code in ('EUR', 'UTA', 'UTE', 'UTW', 'CPC'):
+            country = 'E'
+        else: # WMC
+            # Make sure WMC are loaded after all wards...
+            area_within = Area.objects.filter(type__code__in=('UTW','UTE','MTW','COP','LBW','DIW'), polygons__polygon__contains=geom.geos.point_on_surface)[0]
+            country = area_within.country.code
+        # Can't do the above ons_code checks with new GSS codes, will have to do more PinP checks
+        # Do parents in separate P-in-P code after this is done.
+
+        try:
+            check = control.check(name, area_code, country, geom)
+            if check == True:
+                raise Area.DoesNotExist
+            if isinstance(check, Area):
+                m = check
+                ons_code = m.codes.get(type=code_version)
+            elif ons_code:
+                m = Area.objects.get(codes__type=code_version, codes__code=ons_code)
+            elif unit_id:
+                m = Area.objects.get(codes__type=code_type_os, codes__code=unit_id)
+                m_name = m.names.get(type=name_type).name
+                if name != m_name:
+                    raise Exception, "Unit ID code %s is %s in DB but %s in SHP file" % (unit_id, m_name, name)
+            else:
+                raise Exception, 'Area "%s" (%s) has neither ONS code nor unit ID' % (name, area_code)
+        except Area.DoesNotExist:
+            m = None
+
+        return country, m, ons_code
+
     def patch_boundary_line(self, ons_code, area_code):
         """Fix mistakes in Boundary-Line"""
         if area_code == 'WMC' and ons_code == '42UH012':
@@ -154,3 +214,30 @@ class Command(LabelCommand):
             return 'S12000010'
         return False
 
+def lookup_features(args):
+    """Worker for --processes: parses and looks up a range of the features
+    of a file. Errors are passed back rather than raised, as they only matter
+    if the feature isn't merged into an earlier one when the results are
+    stored."""
+    filename, start, stop, control_name = args
+    __import__(control_name)
+    control = sys.modules[control_name]
+    code_version = CodeType.objects.get(code=control.code_version())
+    name_type = NameType.objects.get(code='O')
+    code_type_os = CodeType.objects.get(code='unit_id')
+
+    command = Command()
+    layer = DataSource(filename)[0]
+    out = []
+    for i in range(start, stop):
+        feat = layer[i]
+        parsed = command.parse_feature(feat)
+        if not parsed:
+            out.append(None)
+            continue
+        try:
+            out.append( (None,) + command.lookup_feature(parsed, feat.geom, control, code_version, code_type_os, name_type) )
+        except Exception, e:
+            # Model exceptions such as Name.DoesNotExist can't be pickled
+            out.append( (Exception('%s: %s' % (e.__class__.__name__, e)), None, None, None) )
+    return out
@@ -11,6 +11,7 @@
 # health authority, County, District, Ward
 
 import csv
+from optparse import make_option
 from django.contrib.gis.geos import Point
 from utils import PostcodeCommand
 
@@ -18,12 +19,23 @@ class Command(PostcodeCommand):
     help = 'Import OS Code-Point Open postcodes'
     args = '<Code-Point CSV files>'
     often = 10000
+    option_list = PostcodeCommand.option_list + (
+        make_option('--bulk', action='store_true', dest='bulk', help='Load each file with COPY and set-based updates, rather than row by row'),
+    )
 
     def handle_label(self, file, **options):
+        if options['bulk']:
+            self.do_postcodes(self.rows(file), 27700)
+        else:
+            for postcode, easting, northing in self.rows(file):
+                location = Point(easting, northing, srid=27700)
+                self.do_postcode(postcode, location)
+        self.print_stats()
+
+    def rows(self, file):
         for row in csv.reader(open(file)):
             if row[1] == '90': continue # Bad postcode
             postcode = row[0].strip().replace(' ', '')
             easting_column = 2 if len(row) == 10 else 10 # A new Code-Point only has 10 columns
-            location = Point(map(float, row[easting_column:easting_column+2]), srid=27700)
-            self.do_postcode(postcode, location)
-        self.print_stats()
+            easting, northing = map(float, row[easting_column:easting_column+2])
+            yield postcode, easting, northing
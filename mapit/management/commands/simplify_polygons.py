@@ -0,0 +1,56 @@
+# This script is used after boundaries have been imported for a generation,
+# to store simplified versions of every area's polygons at each of the
+# standard tolerances, so that the polygon view needn't simplify large areas
+# on every request. Areas that already have their simplified versions are
+# skipped, unless --force is given; importing new polygons for an area throws
+# its simplified versions away. Run it before generation_activate.
+
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from mapit.models import Area, Generation, SimplifiedPolygon, simplify_srids, simplify_tolerances
+
+class Command(NoArgsCommand):
+    help = 'Store simplified polygons for the areas in a generation'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--generation_id', action='store', dest='generation_id', help='Which generation to use (defaults to the new inactive one)'),
+        make_option('--force', action='store_true', dest='force', help='Recreate simplified polygons that already exist'),
+        make_option('--commit', action='store_true', dest='commit', help='Actually update the database'),
+    )
+
+    @transaction.commit_manually
+    def handle_noargs(self, **options):
+        if options['generation_id']:
+            generation = Generation.objects.get(id=options['generation_id'])
+        else:
+            generation = Generation.objects.new()
+            if not generation:
+                raise Exception, "No new generation to be used for import!"
+
+        areas = Area.objects.filter(
+            generation_low__lte=generation, generation_high__gte=generation,
+            polygons__isnull=False,
+        ).distinct()
+        if not options['force']:
+            areas = areas.filter(simplified__isnull=True)
+
+        count = 0
+        for area in areas.iterator():
+            SimplifiedPolygon.objects.filter(area=area).delete()
+            for srid in simplify_srids():
+                polygons = area.collect_polygons(srid)
+                for tolerance in simplify_tolerances(srid):
+                    SimplifiedPolygon.objects.create(
+                        area=area, srid=srid, tolerance=tolerance,
+                        polygon=polygons.simplify(tolerance).hexewkb,
+                    )
+            count += 1
+            if count % 100 == 0:
+                print "Simplified %d areas..." % count
+
+        if options['commit']:
+            transaction.commit()
+            print "%s - simplified %d areas" % (generation, count)
+        else:
+            transaction.rollback()
+            print "%s - would have simplified %d areas, dry run" % (generation, count)
@@ -4,17 +4,27 @@ import sys
 
 from django.core.management.base import LabelCommand
 from django.conf import settings
-from mapit.models import Postcode
+from django.db import connection, transaction
+from psycopg2 import Binary
+from mapit.models import Postcode, GeometrySummary, AreaRelationsFound
+from mapit.transform import transform_points
+from mapit import polygoncache
+from mapit import tiles
+
+# How many polygons to insert per INSERT statement
+POLYGONS_PER_INSERT = 500
 
 def save_polygons(lookup):
+    # Gather up every polygon first, so they can all be written in one go
+    area_ids = []
+    rows = []
     for shape in lookup.values():
         m, poly = shape
         if not poly:
             continue
         sys.stdout.write(".")
         sys.stdout.flush()
-        #g = OGRGeometry(OGRGeomType('MultiPolygon'))
-        m.polygons.all().delete()
+        area_ids.append(m.id)
         for p in poly:
             if p.geom_name == 'POLYGON':
                 shapes = [ p ]
@@ -25,18 +35,68 @@ def save_polygons(lookup):
                 # with Django 1.1, Postgres 8.3, PostGIS 1.3.3 but fails with
                 # Django 1.2, Postgres 8.4, PostGIS 1.5.1, saying that the
                 # dimensions constraint fails - because it is trying to import
-                # a shape as 3D as the WKT contains " 0" at the end of every
-                # co-ordinate. Removing the altitudes from the KML, and/or
-                # using altitudeMode makes no difference to the WKT here, so
-                # the only easy solution appears to be removing the altitude
-                # directly from the WKT before using it.
-                must_be_two_d = g.wkt.replace(' 0,', ',')
-                m.polygons.create(polygon=must_be_two_d)
-        #m.polygon = g.wkt
-        #m.save()
+                # a shape as 3D as the KML contains a " 0" altitude on every
+                # co-ordinate. So drop the Z dimension from the geometry
+                # itself before writing it out.
+                g = g.clone()
+                g.coord_dim = 2
+                rows.append( (m.id, Binary(str(g.wkb))) )
         poly[:] = [] # Clear the polygon's list, so that if it has both an ons_code and unit_id, it's not processed twice
+    if area_ids:
+        replace_polygons(area_ids, rows)
+        # Now that the new polygons are committed, so that no tile can be
+        # made from the old ones again
+        tiles.forget()
     print ""
 
+@transaction.commit_on_success
+def replace_polygons(area_ids, rows):
+    """Replaces all the polygons of the given areas with the given (area ID,
+    WKB) rows, using multi-row INSERTs, in one transaction. Any stored
+    simplified versions or cached outputs of those areas are out of date, so
+    go too, as do the found relations of their generations, and their geometry
+    summaries are worked out again."""
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM mapit_simplifiedpolygon WHERE area_id IN %s', [ tuple(area_ids) ])
+    cursor.execute('DELETE FROM mapit_geometrysummary WHERE area_id IN %s', [ tuple(area_ids) ])
+    cursor.execute('DELETE FROM mapit_geometry WHERE area_id IN %s', [ tuple(area_ids) ])
+    value = '(%%s, ST_GeomFromWKB(%%s, %d))' % settings.MAPIT_AREA_SRID
+    for i in range(0, len(rows), POLYGONS_PER_INSERT):
+        chunk = rows[i:i+POLYGONS_PER_INSERT]
+        cursor.execute(
+            'INSERT INTO mapit_geometry (area_id, polygon) VALUES ' + ', '.join([ value ] * len(chunk)),
+            [ v for row in chunk for v in row ]
+        )
+    GeometrySummary.objects.for_areas(area_ids)
+    AreaRelationsFound.objects.forget(area_ids)
+    polygoncache.forget(area_ids)
+
+class CopyFile(object):
+    """A file-like object reading from an iterator of lines, so that rows can
+    be streamed into COPY without building the whole file first."""
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += self.lines.next()
+            except StopIteration:
+                break
+        if size < 0: size = len(self.buffer)
+        out, self.buffer = self.buffer[:size], self.buffer[size:]
+        return out
+
+    def readline(self, size=-1):
+        if not self.buffer:
+            try:
+                self.buffer = self.lines.next()
+            except StopIteration:
+                pass
+        out, self.buffer = self.buffer, ''
+        return out
+
 class PostcodeCommand(LabelCommand):
     help = 'Import postcodes in some way; subclass this!'
     args = '<data files>'
@@ -59,8 +119,8 @@ class PostcodeCommand(LabelCommand):
                     if pc.postcode[0:2] == 'BT':
                         curr_location = pc.as_irish_grid()
                     else:
-                        pc.location.transform(27700) # Postcode locations are stored as WGS84
-                        curr_location = ( pc.location[0], pc.location[1] )
+                        # Postcode locations are stored as WGS84
+                        curr_location = transform_points([ pc.location.coords ], pc.location.srid, 27700, database=False)[0]
                     curr_location = map(round, curr_location)
                 if curr_location[0] != location[0] or curr_location[1] != location[1]:
                     pc.location = location
@@ -77,3 +137,53 @@ class PostcodeCommand(LabelCommand):
         if self.count['total'] % self.often == 0:
             self.print_stats()
         return pc
+
+    @transaction.commit_on_success
+    def do_postcodes(self, rows, srid):
+        """A bulk version of do_postcode. Takes an iterator of (postcode, x, y)
+        rows in the given SRID, streams them into a staging table with COPY,
+        and then creates and updates postcodes with a few set-based queries,
+        rather than several queries per postcode."""
+        cursor = connection.cursor()
+        cursor.execute('''
+            CREATE TEMPORARY TABLE postcode_import (
+                line serial, postcode varchar(7), x float8, y float8
+            )''')
+        cursor.copy_from(
+            CopyFile( '%s\t%r\t%r\n' % row for row in rows ),
+            'postcode_import', columns=('postcode', 'x', 'y')
+        )
+        # Compare in the import's SRID, to the nearest unit, as do_postcode does
+        cursor.execute('''
+            CREATE TEMPORARY TABLE postcode_merge AS
+            SELECT DISTINCT ON (i.postcode) i.postcode,
+                ST_Transform(ST_SetSRID(ST_MakePoint(i.x, i.y), %s), 4326) AS location,
+                p.id AS postcode_id,
+                p.location IS NULL
+                    OR round(ST_X(ST_Transform(p.location, %s))) != i.x
+                    OR round(ST_Y(ST_Transform(p.location, %s))) != i.y AS changed
+            FROM postcode_import i LEFT JOIN mapit_postcode p ON p.postcode = i.postcode
+            ORDER BY i.postcode, i.line DESC
+        ''', [ srid, srid, srid ])
+
+        cursor.execute('''
+            UPDATE mapit_postcode SET location = m.location
+            FROM postcode_merge m WHERE m.postcode_id = mapit_postcode.id AND m.changed
+        ''')
+        updated = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO mapit_postcode (postcode, location)
+            SELECT postcode, location FROM postcode_merge WHERE postcode_id IS NULL
+        ''')
+        created = cursor.rowcount
+        # Postcodes given more than once are only counted once
+        cursor.execute('SELECT count(*) FROM postcode_merge WHERE postcode_id IS NOT NULL AND NOT changed')
+        unchanged = cursor.fetchone()[0]
+
+        cursor.execute('DROP TABLE postcode_merge')
+        cursor.execute('DROP TABLE postcode_import')
+
+        self.count['total'] += created + updated + unchanged
+        self.count['created'] += created
+        self.count['updated'] += updated
+        self.count['unchanged'] += unchanged
@@ -0,0 +1,66 @@
+# This script fills the polygon cache with every area in a generation, in each
+# of the given formats, in the SRID the polygon view uses by default for the
+# format, unsimplified and at each of the standard tolerances (or those of
+# them given; other tolerances are never cached). Run it after
+# simplify_polygons, before or after generation_activate; the files are only
+# used while their generation is the current one.
+
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from django.conf import settings
+from django.db.models import Max
+from mapit.models import Area, Generation, simplify_tolerances
+from mapit import polygoncache
+
+class Command(NoArgsCommand):
+    help = 'Fill the polygon cache with the areas in a generation'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--generation_id', action='store', dest='generation_id', help='Which generation to use (defaults to the current one)'),
+        make_option('--formats', action='store', dest='formats', default='kml,json,wkt', help='Comma separated formats to render (default kml,json,wkt)'),
+        make_option('--tolerances', action='store', dest='tolerances', help='Comma separated simplification tolerances (defaults to 0 and the standard ones)'),
+        make_option('--force', action='store_true', dest='force', help='Render outputs that are already cached'),
+    )
+
+    def handle_noargs(self, **options):
+        if not polygoncache.cache_dir():
+            raise Exception, "No POLYGON_CACHE_DIR has been set"
+        if options['generation_id']:
+            generation = Generation.objects.get(id=options['generation_id'])
+        else:
+            generation = Generation.objects.current()
+            if not generation:
+                raise Exception, "No current generation to fill the cache for!"
+
+        outputs = []
+        for format in options['formats'].split(','):
+            if format not in polygoncache.CONTENT_TYPES:
+                raise Exception, "Unknown format %s" % format
+            srid = 4326 if format in ('kml', 'json', 'geojson') else settings.MAPIT_AREA_SRID
+            if options['tolerances']:
+                tolerances = [ float(t) for t in options['tolerances'].split(',') ]
+                for tolerance in tolerances:
+                    if tolerance != 0 and tolerance not in simplify_tolerances(srid):
+                        raise Exception, "Only 0 and the standard tolerances are cached, not %s" % tolerance
+            else:
+                tolerances = [ 0.0 ] + list(simplify_tolerances(srid))
+            outputs.extend( (srid, format, tolerance) for tolerance in tolerances )
+
+        areas = Area.objects.filter(
+            generation_low__lte=generation, generation_high__gte=generation,
+            polygons__isnull=False,
+        ).annotate(polygons_version=Max('polygons__id'))
+
+        count = 0
+        for area in areas.iterator():
+            for srid, format, tolerance in outputs:
+                filename = polygoncache.path(area.id, area.polygons_version, generation.id, srid, format, tolerance)
+                if options['force'] or not polygoncache.touch(filename):
+                    content = polygoncache.render_polygon(area, srid, format, tolerance)
+                    if content is not None:
+                        polygoncache.store(filename, content)
+            count += 1
+            if count % 100 == 0:
+                print "Cached %d areas..." % count
+
+        polygoncache.sweep()
+        print "%s - cached %d outputs of each of %d areas" % (generation, len(outputs), count)
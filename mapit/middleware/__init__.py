@@ -1,9 +1,14 @@
 import re
+import itertools
 
 class JSONPMiddleware(object):
     def process_response(self, request, response):
         if request.GET.get('callback') and re.match('[a-zA-Z0-9_]+$', request.GET.get('callback')):
-            response.content = request.GET.get('callback').encode('utf-8') + '(' + response.content + ')'
+            callback = request.GET.get('callback').encode('utf-8')
+            if getattr(response, 'streaming', False):
+                response._container = itertools.chain([ callback + '(' ], response._container, [ ')' ])
+            else:
+                response.content = callback + '(' + response.content + ')'
             response.status_code = 200 # Must return OK for JSONP to be processed
         return response
 
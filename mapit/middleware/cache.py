@@ -1,7 +1,17 @@
-# Django's cache middleware, patched to use get_full_path() as they can be cached.
+# Django's cache middleware, patched to use get_full_path() as they can be cached,
+# and to store responses as a manifest and compressed chunks rather than pickled
+# HttpResponses, as memcached refuses items over 1MB, which would otherwise
+# leave the biggest responses never cached. Optionally, each process keeps the
+# most recently used entries itself too (see LocalCache), so that the most
+# popular pages needn't go to memcached at all.
+
+import time
+import zlib
+import threading
 
 from django.conf import settings
 from django.core.cache import cache
+from django.http import HttpResponse
 from django.utils.cache import patch_response_headers, get_max_age, cc_delim_re
 from django.utils.encoding import iri_to_uri
 from django.utils.hashcompat import md5_constructor
@@ -45,9 +55,23 @@ class UpdateCacheMiddleware(object):
         patch_response_headers(response, timeout)
         if timeout:
             cache_key = learn_cache_key(request, response, timeout, self.key_prefix)
-            cache.set(cache_key, response, timeout)
+            if getattr(response, 'streaming', False):
+                # Added to Django's: a streamed response is cached once it has all been sent.
+                # Its headers are taken now, as middleware after this one (such as gzip)
+                # may change them to suit the body it sends, which isn't what is cached.
+                response._container = self.cache_when_sent(response._container, cache_key,
+                    response.status_code, response.items(), timeout)
+            else:
+                store_response(cache_key, response.status_code, response.items(), response.content, timeout)
         return response
 
+    def cache_when_sent(self, content, cache_key, status, headers, timeout):
+        sent = []
+        for chunk in content:
+            sent.append(chunk)
+            yield chunk
+        store_response(cache_key, status, headers, ''.join(sent), timeout)
+
 class FetchFromCacheMiddleware(object):
     """
     Request-phase cache middleware that fetches a page from the cache.
@@ -82,7 +106,7 @@ class FetchFromCacheMiddleware(object):
             request._cache_update_cache = True
             return None # No cache information available, need to rebuild.
 
-        response = cache.get(cache_key, None)
+        response = fetch_response(cache_key)
         if response is None:
             request._cache_update_cache = True
             return None # No cache information available, need to rebuild.
@@ -90,6 +114,167 @@ class FetchFromCacheMiddleware(object):
         request._cache_update_cache = False
         return response
 
+# Added to Django's: chunked storage of responses
+
+# Comfortably under memcached's default 1MB item limit
+CHUNK_SIZE = 1000 * 1000 - 1024
+
+def store_response(cache_key, status, headers, content, timeout):
+    """Stores a response under cache_key as a manifest of its status and
+    headers. The body, compressed unless it already is, goes in the manifest
+    if it is small enough, or otherwise in chunks under their own keys, which
+    are stored first so that a manifest is never seen without them."""
+    headers = list(headers)
+    compressed = not [ h for h, v in headers if h.lower() == 'content-encoding' ]
+    if compressed:
+        content = zlib.compress(content)
+    manifest = { 'status': status, 'headers': headers, 'compressed': compressed }
+    if len(content) <= CHUNK_SIZE:
+        manifest['content'] = content
+    else:
+        # Named after the body, so that a response being stored by another
+        # process at the same time can't mix its chunks with these
+        prefix = '%s.chunk.%s' % (cache_key, md5_constructor(content).hexdigest())
+        offsets = range(0, len(content), CHUNK_SIZE)
+        keys = [ '%s.%d' % (prefix, n) for n in offsets ]
+        page_cache.set_many(dict( (key, content[n:n+CHUNK_SIZE]) for key, n in zip(keys, offsets) ), timeout)
+        manifest['chunks'] = keys
+    page_cache.set(cache_key, manifest, timeout)
+
+def fetch_response(cache_key):
+    """Returns the response stored under cache_key, reassembling its body
+    from its chunks with one more cache round-trip if it has any, or None if
+    it, or any of its chunks, isn't in the cache."""
+    manifest = page_cache.get(cache_key, None)
+    if not isinstance(manifest, dict):
+        return None
+    if 'chunks' in manifest:
+        chunks = page_cache.get_many(manifest['chunks'])
+        if len(chunks) != len(manifest['chunks']):
+            return None
+        content = ''.join([ chunks[key] for key in manifest['chunks'] ])
+    else:
+        content = manifest['content']
+    if manifest['compressed']:
+        content = zlib.decompress(content)
+    response = HttpResponse(content, status=manifest['status'])
+    for header, value in manifest['headers']:
+        response[header] = value
+    return response
+
+# Added to Django's: a per-process tier in front of the shared cache
+
+class LocalCache(object):
+    """A bounded, least recently used cache held by this process, in front
+    of the shared cache, with the same get/set methods as it. Entries are
+    kept for no more than timeout seconds, as the shared cache may be
+    updated by another process, and once they take up more than max_size
+    bytes, the least recently used are dropped. hits and misses count how
+    many lookups it has answered itself and how many it has passed on."""
+    def __init__(self, shared, max_size, timeout):
+        self.shared = shared
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = {} # key -> (expires, size, value)
+        self.used = {} # key -> when last looked up, in lookups
+        self.size = 0
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        found = self.get_many([ key ])
+        return found.get(key, default)
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        self.lock.acquire()
+        try:
+            now = time.time()
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry and entry[0] > now:
+                    self.clock += 1
+                    self.used[key] = self.clock
+                    found[key] = entry[2]
+                    self.hits += 1
+                else:
+                    missing.append(key)
+                    self.misses += 1
+        finally:
+            self.lock.release()
+        if missing:
+            shared = self.shared.get_many(missing)
+            self.remember(shared, self.timeout)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=None):
+        self.set_many({ key: value }, timeout)
+
+    def set_many(self, data, timeout=None):
+        self.shared.set_many(data, timeout)
+        self.remember(data, timeout)
+
+    def remember(self, data, timeout=None):
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        self.lock.acquire()
+        try:
+            expires = time.time() + timeout
+            for key, value in data.items():
+                self.forget(key)
+                size = size_of(value)
+                if size > self.max_size / 4:
+                    continue # Would push out too much else
+                self.clock += 1
+                self.entries[key] = (expires, size, value)
+                self.used[key] = self.clock
+                self.size += size
+            if self.size > self.max_size:
+                self.evict()
+        finally:
+            self.lock.release()
+
+    def forget(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            del self.used[key]
+            self.size -= entry[1]
+
+    def evict(self):
+        """Drops expired entries, then the least recently used until there
+        is some room, so that this isn't done on every set."""
+        now = time.time()
+        for key in [ key for key, entry in self.entries.items() if entry[0] <= now ]:
+            self.forget(key)
+        for used, key in sorted( (used, key) for key, used in self.used.items() ):
+            if self.size <= self.max_size * 0.9:
+                break
+            self.forget(key)
+
+    def stats(self):
+        return { 'hits': self.hits, 'misses': self.misses, 'items': len(self.entries), 'size': self.size }
+
+def size_of(value):
+    """Roughly how many bytes a cached value (a string, a header list, or
+    a response manifest) takes up."""
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, dict):
+        value = value.values()
+    if isinstance(value, (list, tuple)):
+        return 64 + sum([ size_of(v) for v in value ])
+    return 64
+
+if getattr(settings, 'MAPIT_LOCAL_CACHE_SIZE', 0):
+    page_cache = LocalCache(cache, settings.MAPIT_LOCAL_CACHE_SIZE * 1024 * 1024,
+        getattr(settings, 'MAPIT_LOCAL_CACHE_TIMEOUT', 60))
+else:
+    page_cache = cache
+
 # and bits of django/utils/cache.py
 
 def _generate_cache_key(request, headerlist, key_prefix):
@@ -121,7 +306,7 @@ def get_cache_key(request, key_prefix=None):
     if key_prefix is None:
         key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
     cache_key = _generate_cache_header_key(key_prefix, request)
-    headerlist = cache.get(cache_key, None)
+    headerlist = page_cache.get(cache_key, None)
     if headerlist is not None:
         return _generate_cache_key(request, headerlist, key_prefix)
     else:
@@ -148,11 +333,11 @@ def learn_cache_key(request, response, cache_timeout=None, key_prefix=None):
     if response.has_header('Vary'):
         headerlist = ['HTTP_'+header.upper().replace('-', '_')
                       for header in cc_delim_re.split(response['Vary'])]
-        cache.set(cache_key, headerlist, cache_timeout)
+        page_cache.set(cache_key, headerlist, cache_timeout)
         return _generate_cache_key(request, headerlist, key_prefix)
     else:
         # if there is no Vary header, we still need a cache key
         # for the request.path
-        cache.set(cache_key, [], cache_timeout)
+        page_cache.set(cache_key, [], cache_timeout)
         return _generate_cache_key(request, [], key_prefix)
 
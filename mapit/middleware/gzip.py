@@ -1,12 +1,41 @@
 # Django's gzip middleware, patched to alter the ETag as it should do.
 
 import re
+import zlib
 
 from django.utils.text import compress_string
 from django.utils.cache import patch_vary_headers
 
 re_accepts_gzip = re.compile(r'\bgzip\b')
 
+# Added to Django's module, so that gzip;q=0 is taken to mean no gzip
+def accepts_gzip(request):
+    """Whether the request's Accept-Encoding header allows gzip."""
+    ae = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if not re_accepts_gzip.search(ae):
+        return False
+    for coding in ae.split(','):
+        params = coding.split(';')
+        if params[0].strip().lower() != 'gzip':
+            continue
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+# Added to Django's module, for streamed responses
+def compress_sequence(sequence):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for item in sequence:
+        data = compressor.compress(item)
+        if data: yield data
+    yield compressor.flush()
+
 class GZipMiddleware(object):
     """
     This middleware compresses content if the browser allows gzip compression.
@@ -15,7 +44,10 @@ class GZipMiddleware(object):
     """
     def process_response(self, request, response):
         # It's not worth compressing non-OK or really short responses.
-        if response.status_code != 200 or len(response.content) < 200:
+        # Streamed responses are assumed to be long; reading their content
+        # here would use them up.
+        streaming = getattr(response, 'streaming', False)
+        if response.status_code != 200 or (not streaming and len(response.content) < 200):
             return response
 
         patch_vary_headers(response, ('Accept-Encoding',))
@@ -30,15 +62,19 @@ class GZipMiddleware(object):
             if not ctype.startswith("text/") or "javascript" in ctype:
                 return response
 
-        ae = request.META.get('HTTP_ACCEPT_ENCODING', '')
-        if not re_accepts_gzip.search(ae):
+        if not accepts_gzip(request):
             return response
 
         # Added to Django's function
         if response.has_header('ETag'):
             response['ETag'] = re.sub('"$', ';gzip"', response['ETag'])
 
-        response.content = compress_string(response.content)
+        if streaming:
+            response._container = compress_sequence(response._container)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            response.content = compress_string(response.content)
+            response['Content-Length'] = str(len(response.content))
         response['Content-Encoding'] = 'gzip'
-        response['Content-Length'] = str(len(response.content))
         return response
@@ -0,0 +1,120 @@
+# encoding: utf-8
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+from django.conf import settings
+
+class Migration(SchemaMigration):
+    
+    def forwards(self, orm):
+        
+        # Adding model 'SimplifiedPolygon'
+        db.create_table('mapit_simplifiedpolygon', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('area', self.gf('django.db.models.fields.related.ForeignKey')(related_name='simplified', to=orm['mapit.Area'])),
+            ('srid', self.gf('django.db.models.fields.IntegerField')()),
+            ('tolerance', self.gf('django.db.models.fields.FloatField')()),
+            ('polygon', self.gf('django.db.models.fields.TextField')()),
+        ))
+        db.send_create_signal('mapit', ['SimplifiedPolygon'])
+
+        # Adding unique constraint on 'SimplifiedPolygon', fields ['area', 'srid', 'tolerance']
+        db.create_unique('mapit_simplifiedpolygon', ['area_id', 'srid', 'tolerance'])
+    
+    
+    def backwards(self, orm):
+        
+        # Removing unique constraint on 'SimplifiedPolygon', fields ['area', 'srid', 'tolerance']
+        db.delete_unique('mapit_simplifiedpolygon', ['area_id', 'srid', 'tolerance'])
+
+        # Deleting model 'SimplifiedPolygon'
+        db.delete_table('mapit_simplifiedpolygon')
+    
+    models = {
+        'mapit.area': {
+            'Meta': {'object_name': 'Area'},
+            'country': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'areas'", 'blank': 'True', 'null': 'True', 'to': "orm['mapit.Country']"}),
+            'generation_high': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'final_areas'", 'null': 'True', 'to': "orm['mapit.Generation']"}),
+            'generation_low': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'new_areas'", 'null': 'True', 'to': "orm['mapit.Generation']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'}),
+            'parent_area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'children'", 'blank': 'True', 'null': 'True', 'to': "orm['mapit.Area']"}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'areas'", 'to': "orm['mapit.Type']"})
+        },
+        'mapit.code': {
+            'Meta': {'unique_together': "(('area', 'type'),)", 'object_name': 'Code'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'codes'", 'to': "orm['mapit.Area']"}),
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'codes'", 'to': "orm['mapit.CodeType']"})
+        },
+        'mapit.codetype': {
+            'Meta': {'object_name': 'CodeType'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '10', 'unique': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'mapit.country': {
+            'Meta': {'object_name': 'Country'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '1', 'unique': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100', 'unique': 'True'})
+        },
+        'mapit.generation': {
+            'Meta': {'object_name': 'Generation'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'blank': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'mapit.geometry': {
+            'Meta': {'object_name': 'Geometry'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'polygons'", 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'polygon': ('django.contrib.gis.db.models.fields.PolygonField', [], {'srid': str(settings.MAPIT_AREA_SRID)})
+        },
+        'mapit.name': {
+            'Meta': {'unique_together': "(('area', 'type'),)", 'object_name': 'Name'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'names'", 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'names'", 'to': "orm['mapit.NameType']"})
+        },
+        'mapit.nametype': {
+            'Meta': {'object_name': 'NameType'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '10', 'unique': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'mapit.postcode': {
+            'Meta': {'object_name': 'Postcode'},
+            'areas': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'postcodes'", 'blank': 'True', 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'location': ('django.contrib.gis.db.models.fields.PointField', [], {'null': 'True'}),
+            'postcode': ('django.db.models.fields.CharField', [], {'max_length': '7', 'unique': 'True', 'db_index': 'True'})
+        },
+        'mapit.postcodearea': {
+            'Meta': {'unique_together': "(('generation', 'postcode', 'area'),)", 'object_name': 'PostcodeArea'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'postcode_memberships'", 'to': "orm['mapit.Area']"}),
+            'generation': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'postcode_memberships'", 'to': "orm['mapit.Generation']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'postcode': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'area_memberships'", 'to': "orm['mapit.Postcode']"})
+        },
+        'mapit.simplifiedpolygon': {
+            'Meta': {'unique_together': "(('area', 'srid', 'tolerance'),)", 'object_name': 'SimplifiedPolygon'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'simplified'", 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'polygon': ('django.db.models.fields.TextField', [], {}),
+            'srid': ('django.db.models.fields.IntegerField', [], {}),
+            'tolerance': ('django.db.models.fields.FloatField', [], {})
+        },
+        'mapit.type': {
+            'Meta': {'object_name': 'Type'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '3', 'unique': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+    
+    complete_apps = ['mapit']
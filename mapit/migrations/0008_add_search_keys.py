@@ -0,0 +1,162 @@
+# encoding: utf-8
+import re
+import datetime
+import unicodedata
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+from django.conf import settings
+
+# A copy of mapit.utils.normalise_name as it was when this migration was
+# written, so that the keys filled in here don't change if it does
+def normalise_name(name):
+    name = unicodedata.normalize('NFKD', unicode(name))
+    name = u''.join(c for c in name if not unicodedata.combining(c))
+    return re.sub('(?u)[\W_]+', ' ', name.lower()).strip()[:100]
+
+# How many rows to fill in with each UPDATE
+ROWS_PER_UPDATE = 1000
+
+def fill_search_keys(table, rows):
+    """Sets the search_key of each of the (id, name) rows in table, with one
+    UPDATE per batch of rows rather than one per row."""
+    for i in range(0, len(rows), ROWS_PER_UPDATE):
+        batch = rows[i:i+ROWS_PER_UPDATE]
+        db.execute(
+            'UPDATE %s SET search_key = keys.search_key FROM (VALUES %s) AS keys (id, search_key) WHERE %s.id = keys.id'
+                % (table, ', '.join([ '(%s, %s)' ] * len(batch)), table),
+            [ v for id, name in batch for v in (id, normalise_name(name)) ]
+        )
+
+class Migration(SchemaMigration):
+    
+    def forwards(self, orm):
+        
+        # Adding field 'Area.search_key'
+        db.add_column('mapit_area', 'search_key', self.gf('django.db.models.fields.CharField')(default='', max_length=100, blank=True), keep_default=False)
+
+        # Adding field 'Name.search_key'
+        db.add_column('mapit_name', 'search_key', self.gf('django.db.models.fields.CharField')(default='', max_length=100, blank=True), keep_default=False)
+
+        # Fuzzy searches need pg_trgm; if it's installed later, create these by hand
+        if db.execute("SELECT COUNT(*) FROM pg_opclass WHERE opcname = 'gin_trgm_ops'")[0][0]:
+            db.execute('CREATE INDEX mapit_area_search_key_trgm ON mapit_area USING gin (search_key gin_trgm_ops)')
+            db.execute('CREATE INDEX mapit_name_search_key_trgm ON mapit_name USING gin (search_key gin_trgm_ops)')
+
+        if not db.dry_run:
+            fill_search_keys('mapit_area', list(orm.Area.objects.values_list('id', 'name')))
+            fill_search_keys('mapit_name', list(orm.Name.objects.values_list('id', 'name')))
+
+        # The indexes syncdb makes for the fields' db_index, made by hand once
+        # the keys are filled in, so that the varchar_pattern_ops one, which
+        # the prefix searches' LIKE needs, is certain to be there
+        for table in ('mapit_area', 'mapit_name'):
+            db.execute('CREATE INDEX %s_search_key ON %s (search_key)' % (table, table))
+            db.execute('CREATE INDEX %s_search_key_like ON %s (search_key varchar_pattern_ops)' % (table, table))
+    
+    
+    def backwards(self, orm):
+        
+        # Deleting field 'Area.search_key'
+        db.delete_column('mapit_area', 'search_key')
+
+        # Deleting field 'Name.search_key'
+        db.delete_column('mapit_name', 'search_key')
+    
+    models = {
+        'mapit.arearelation': {
+            'Meta': {'unique_together': "(('generation', 'area', 'relation', 'related_area'),)", 'object_name': 'AreaRelation'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'relations'", 'to': "orm['mapit.Area']"}),
+            'generation': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'area_relations'", 'to': "orm['mapit.Generation']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'related_area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'related_relations'", 'to': "orm['mapit.Area']"}),
+            'relation': ('django.db.models.fields.CharField', [], {'max_length': '10'})
+        },
+        'mapit.area': {
+            'Meta': {'object_name': 'Area'},
+            'country': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'areas'", 'blank': 'True', 'null': 'True', 'to': "orm['mapit.Country']"}),
+            'generation_high': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'final_areas'", 'null': 'True', 'to': "orm['mapit.Generation']"}),
+            'generation_low': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'new_areas'", 'null': 'True', 'to': "orm['mapit.Generation']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'}),
+            'parent_area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'children'", 'blank': 'True', 'null': 'True', 'to': "orm['mapit.Area']"}),
+            'search_key': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '100', 'blank': 'True'}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'areas'", 'to': "orm['mapit.Type']"})
+        },
+        'mapit.code': {
+            'Meta': {'unique_together': "(('area', 'type'),)", 'object_name': 'Code'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'codes'", 'to': "orm['mapit.Area']"}),
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'codes'", 'to': "orm['mapit.CodeType']"})
+        },
+        'mapit.codetype': {
+            'Meta': {'object_name': 'CodeType'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '10', 'unique': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'mapit.country': {
+            'Meta': {'object_name': 'Country'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '1', 'unique': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100', 'unique': 'True'})
+        },
+        'mapit.generation': {
+            'Meta': {'object_name': 'Generation'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'False', 'blank': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'mapit.geometry': {
+            'Meta': {'object_name': 'Geometry'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'polygons'", 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'polygon': ('django.contrib.gis.db.models.fields.PolygonField', [], {'srid': str(settings.MAPIT_AREA_SRID)})
+        },
+        'mapit.name': {
+            'Meta': {'unique_together': "(('area', 'type'),)", 'object_name': 'Name'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'names'", 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'search_key': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '100', 'blank': 'True'}),
+            'type': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'names'", 'to': "orm['mapit.NameType']"})
+        },
+        'mapit.nametype': {
+            'Meta': {'object_name': 'NameType'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '10', 'unique': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'mapit.postcode': {
+            'Meta': {'object_name': 'Postcode'},
+            'areas': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'postcodes'", 'blank': 'True', 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'location': ('django.contrib.gis.db.models.fields.PointField', [], {'null': 'True'}),
+            'postcode': ('django.db.models.fields.CharField', [], {'max_length': '7', 'unique': 'True', 'db_index': 'True'})
+        },
+        'mapit.postcodearea': {
+            'Meta': {'unique_together': "(('generation', 'postcode', 'area'),)", 'object_name': 'PostcodeArea'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'postcode_memberships'", 'to': "orm['mapit.Area']"}),
+            'generation': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'postcode_memberships'", 'to': "orm['mapit.Generation']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'postcode': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'area_memberships'", 'to': "orm['mapit.Postcode']"})
+        },
+        'mapit.simplifiedpolygon': {
+            'Meta': {'unique_together': "(('area', 'srid', 'tolerance'),)", 'object_name': 'SimplifiedPolygon'},
+            'area': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'simplified'", 'to': "orm['mapit.Area']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'polygon': ('django.db.models.fields.TextField', [], {}),
+            'srid': ('django.db.models.fields.IntegerField', [], {}),
+            'tolerance': ('django.db.models.fields.FloatField', [], {})
+        },
+        'mapit.type': {
+            'Meta': {'object_name': 'Type'},
+            'code': ('django.db.models.fields.CharField', [], {'max_length': '3', 'unique': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '200', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        }
+    }
+    
+    complete_apps = ['mapit']
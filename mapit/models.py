@@ -1,25 +1,80 @@
 import re
+import copy
+import time
 import itertools
 
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import GEOSGeometry
 from django.conf import settings
-from django.db import connection
+from django.core.cache import cache
+from django.db import connection, transaction, IntegrityError
+from django.utils import simplejson
 
 from mapit.managers import Manager, GeoManager
+from mapit.utils import normalise_name
+from mapit.transform import transform
+from mapit import polygoncache
+from mapit import tiles
 from mapit import countries
 
+# The current and new generations are remembered by each process, and only
+# looked up again once the version stored under this key in the shared cache
+# changes, which saving or deleting a Generation does. Processes check the
+# version at most every GENERATION_CHECK_INTERVAL seconds.
+GENERATION_VERSION_KEY = 'mapit-generation-version'
+GENERATION_CHECK_INTERVAL = 5
+_generation_cache = { 'checked': 0, 'version': None }
+
 class GenerationManager(models.Manager):
     def current(self):
+        return self._cached('current', self._current)
+
+    def new(self):
+        return self._cached('new', self._new)
+
+    def _current(self):
         latest_on = self.get_query_set().filter(active=True).order_by('-id')
         if latest_on: return latest_on[0]
         return 0
 
-    def new(self):
+    def _new(self):
         latest = self.get_query_set().order_by('-id')
         if not latest or latest[0].active:
             return None
         return latest[0]
-        
+
+    def _cached(self, name, lookup):
+        # The cache is only ever replaced, never emptied and refilled, so that
+        # another thread can't see it half done
+        global _generation_cache
+        cached = _generation_cache
+        now = time.time()
+        if now - cached['checked'] >= GENERATION_CHECK_INTERVAL:
+            version = cache.get(GENERATION_VERSION_KEY)
+            if version is None:
+                cache.add(GENERATION_VERSION_KEY, now)
+                version = cache.get(GENERATION_VERSION_KEY)
+            if version != cached['version']:
+                cached = { 'version': version }
+            else:
+                cached = dict(cached)
+            cached['checked'] = now
+            _generation_cache = cached
+        # If there's no working shared cache (e.g. the dummy one when
+        # debugging), we can't know when to look again, so always look
+        if cached['version'] is None:
+            return lookup()
+        if name not in cached:
+            cached[name] = lookup()
+        # A copy, so that changing it doesn't change everyone else's
+        return copy.copy(cached[name]) if cached[name] else cached[name]
+
+    def invalidate(self):
+        """Makes every process look up the current and new generations again."""
+        global _generation_cache
+        cache.set(GENERATION_VERSION_KEY, time.time())
+        _generation_cache = { 'checked': 0, 'version': None }
+
 class Generation(models.Model):
     active = models.BooleanField(default=False)
     created = models.DateTimeField(auto_now_add=True)
@@ -27,6 +82,14 @@ class Generation(models.Model):
 
     objects = GenerationManager()
 
+    def save(self, *args, **kwargs):
+        super(Generation, self).save(*args, **kwargs)
+        Generation.objects.invalidate()
+
+    def delete(self, *args, **kwargs):
+        super(Generation, self).delete(*args, **kwargs)
+        Generation.objects.invalidate()
+
     def __unicode__(self):
         id = self.id or '?'
         return "Generation %s (%sactive)" % (id, "" if self.active else "in")
@@ -56,6 +119,25 @@ class Type(models.Model):
     def __unicode__(self):
         return '%s (%s)' % (self.description, self.code)
 
+# The DE-9IM intersection matrix patterns of the relationships between two
+# polygons that can be asked for by AreaManager.intersect_ids
+RELATION_PATTERNS = {
+    'touches': ( 'FT*******', 'F**T*****', 'F***T****' ),
+    'overlaps': ( 'T*T***T**', ),
+    'covers': ( 'T*****FF*', '*T****FF*', '***T**FF*', '****T*FF*' ),
+    'coveredby': ( 'T*F**F***', '*TF**F***', '**FT*F***', '**F*TF***' ),
+}
+
+def relation_regex(query_types):
+    """Returns a regular expression matching the intersection matrices of
+    any of the given relationships."""
+    return '^(%s)$' % '|'.join(
+        pattern.replace('T', '[^F]').replace('*', '.')
+        for type in query_types for pattern in RELATION_PATTERNS[type]
+    )
+
+_fuzzy_search_available = None
+
 class AreaManager(models.GeoManager):
     def by_location(self, location, generation=None):
         if generation is None: generation = Generation.objects.current()
@@ -105,36 +187,153 @@ class AreaManager(models.GeoManager):
 	# then fetch just the Areas that are in the right generation(s).
         # At least Like A Prayer is on. XXX
 
+        # If this worker has the shapes in memory, don't ask the database
+        from mapit.pointindex import get_index
+        index = get_index(generation)
+        if index is not None:
+            return Area.objects.filter(
+                id__in=list(index.areas_at(location)),
+                generation_low__lte=generation, generation_high__gte=generation
+            ).select_related('type', 'country')
+
         # list() to force evaluation here, we don't want it as a subquery
         geoms = list(Geometry.objects.filter(polygon__contains=location).defer('polygon'))
         return Area.objects.filter(
             polygons__in=geoms,
             generation_low__lte=generation, generation_high__gte=generation
-        )
+        ).select_related('type', 'country')
+
+    def ids_by_locations(self, points, srid, generation=None):
+        """Given a list of (x, y) points in srid, returns a list of sets of
+        the IDs of the areas in generation containing each point. This is
+        one spatial join for the whole list, not a query per point."""
+        if generation is None: generation = Generation.objects.current()
+        generation = getattr(generation, 'id', generation)
+        out = [ set() for point in points ]
+        if not points: return out
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT points.i, mapit_area.id
+            FROM (
+                SELECT i, ST_Transform(ST_SetSRID(ST_MakePoint((%%s::float8[])[i], (%%s::float8[])[i]), %%s), %d) AS location
+                FROM generate_series(1, %%s) AS i
+            ) AS points, mapit_geometry, mapit_area
+            WHERE ST_Contains(mapit_geometry.polygon, points.location)
+                AND mapit_area.id = mapit_geometry.area_id
+                AND mapit_area.generation_low_id <= %%s AND mapit_area.generation_high_id >= %%s
+        ''' % settings.MAPIT_AREA_SRID, [
+            [ p[0] for p in points ], [ p[1] for p in points ], int(srid), len(points),
+            generation, generation
+        ])
+        for i, area_id in cursor.fetchall():
+            out[i-1].add(area_id)
+        return out
 
     def by_postcode(self, postcode, generation=None):
         if not generation: generation = Generation.objects.current()
+        # Use the precomputed membership if find_postcode_areas has been run
+        # for this generation
+        areas = list(Area.objects.filter(
+            postcode_memberships__postcode=postcode, postcode_memberships__generation=generation
+        ).select_related('type', 'country'))
+        if areas: return areas
         return list(itertools.chain(
             self.by_location(postcode.location, generation),
             postcode.areas.filter(
                 generation_low__lte=generation, generation_high__gte=generation
-            )
+            ).select_related('type', 'country')
         ))
 
-    def intersect(self, query_type, area):
+    def intersect_ids(self, query_type, area, types=None, generation=None):
+        """Returns the IDs of the areas in generation, of one of types if
+        given, with a polygon that has one of the query_type relationships
+        (touches, overlaps, covers, coveredby) to area. The area's polygons
+        are collected once, and candidates are narrowed down by bounding box,
+        generation and type before any exact test. Asking for more than one
+        relationship computes each candidate's intersection matrix once and
+        checks it against them all. If find_area_relations has found the
+        area's relations in the generation, the answer is looked up from
+        those instead, with one query, even if there are none."""
         if not isinstance(query_type, list): query_type = [ query_type ]
+        if generation is None: generation = Generation.objects.current()
+        generation = getattr(generation, 'id', generation)
 
-        where = [
-            'mapit_geometry.area_id = mapit_area.id',
-            'mapit_geometry.polygon && (select st_collect(polygon) from mapit_geometry where area_id=%s)',
-        ]
-        where.append('(' + ' OR '.join([ 'ST_%s(mapit_geometry.polygon, (select st_collect(polygon) from mapit_geometry where area_id=%%s))' % type for type in query_type ]) + ')')
+        # No rows if they haven't been found; a row of nulls if there are none
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT mapit_arearelation.related_area_id, mapit_arearelation.relation, mapit_type.code
+            FROM mapit_arearelationsfound
+                LEFT JOIN mapit_arearelation ON mapit_arearelation.area_id = mapit_arearelationsfound.area_id
+                    AND mapit_arearelation.generation_id = mapit_arearelationsfound.generation_id
+                LEFT JOIN mapit_area ON mapit_area.id = mapit_arearelation.related_area_id
+                LEFT JOIN mapit_type ON mapit_type.id = mapit_area.type_id
+            WHERE mapit_arearelationsfound.area_id = %s AND mapit_arearelationsfound.generation_id = %s
+        ''', [ area.id, generation ])
+        relations = cursor.fetchall()
+        if relations:
+            ids = set( id for id, relation, type in relations
+                if relation in query_type and (not types or type in types) )
+            return list(ids)
+
+        where = [ 'mapit_geometry.polygon && target.polygon' ]
+        params = [ area.id, area.id, generation, generation ]
+        if types:
+            where.append('mapit_area.type_id IN (SELECT id FROM mapit_type WHERE code IN %s)')
+            params.append(tuple(types))
+        if len(query_type) == 1:
+            where.append('ST_%s(mapit_geometry.polygon, target.polygon)' % query_type[0])
+            relation = ''
+        else:
+            relation = ', ST_Relate(mapit_geometry.polygon, target.polygon) AS relation'
+
+        query = '''
+            SELECT DISTINCT mapit_area.id%s
+            FROM (SELECT ST_Collect(polygon) AS polygon FROM mapit_geometry WHERE area_id = %%s) AS target,
+                mapit_geometry, mapit_area
+            WHERE mapit_area.id = mapit_geometry.area_id AND mapit_area.id != %%s
+                AND mapit_area.generation_low_id <= %%s AND mapit_area.generation_high_id >= %%s
+                AND %s
+        ''' % (relation, ' AND '.join(where))
+        if relation:
+            query = 'SELECT DISTINCT id FROM (%s) AS candidate WHERE relation ~ %%s' % query
+            params.append(relation_regex(query_type))
 
-        return Area.objects.exclude(id=area.id).extra(
-            tables = [ 'mapit_geometry' ],
-            where = where,
-            params = [ area.id ] * ( 1 + len(query_type) ),
-        )
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        return [ row[0] for row in cursor.fetchall() ]
+
+    def filter_by_name(self, name, fuzzy=False):
+        """Returns the areas with a name (any of their names, or their display
+        name) starting with name, ignoring case, accents and punctuation. If
+        fuzzy, returns the areas with a name similar to name instead, most
+        similar first; this needs pg_trgm. The names are matched with a
+        subquery, so the queryset can be filtered further (by generation or
+        type, say) and the database does it all at once."""
+        key = normalise_name(name)
+        if not key: return self.none()
+        if not fuzzy:
+            return self.extra(
+                where = [ 'mapit_area.id IN (SELECT id FROM mapit_area WHERE search_key LIKE %s UNION SELECT area_id FROM mapit_name WHERE search_key LIKE %s)' ],
+                params = [ key + '%' ] * 2
+            )
+        # An area's similarity is that of its most similar name; ones that
+        # don't match are less similar than any that do, so needn't be left out
+        return self.extra(
+            select = { 'name_rank': 'GREATEST(similarity(mapit_area.search_key, %s), (SELECT max(similarity(search_key, %s)) FROM mapit_name WHERE area_id = mapit_area.id))' },
+            select_params = [ key, key ],
+            where = [ 'mapit_area.id IN (SELECT id FROM mapit_area WHERE search_key %% %s UNION SELECT area_id FROM mapit_name WHERE search_key %% %s)' ],
+            params = [ key, key ]
+        ).order_by('-name_rank', 'id')
+
+    def fuzzy_search_available(self):
+        """Returns whether the pg_trgm functions filter_by_name(fuzzy=True)
+        uses are installed in the database."""
+        global _fuzzy_search_available
+        if _fuzzy_search_available is None:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM pg_proc WHERE proname = 'similarity'")
+            _fuzzy_search_available = cursor.fetchone()[0] > 0
+        return _fuzzy_search_available
 
     def get_or_create_with_name(self, country=None, type=None, name_type='', name=''):
         current_generation = Generation.objects.current()
@@ -173,16 +372,21 @@ class Area(models.Model):
     country = models.ForeignKey(Country, related_name='areas', null=True, blank=True)
     generation_low = models.ForeignKey(Generation, related_name='new_areas', null=True)
     generation_high = models.ForeignKey(Generation, related_name='final_areas', null=True)
+    search_key = models.CharField(max_length=100, editable=False, blank=True, db_index=True) # Set from name, see normalise_name
 
     objects = AreaManager()
 
     class Meta:
         ordering = ('name', 'type')
 
+    def save(self, *args, **kwargs):
+        self.search_key = normalise_name(self.name)
+        super(Area, self).save(*args, **kwargs)
+
     @property
     def all_codes(self):
-        if not getattr(self, 'code_list', None):
-            self.code_list = self.codes.all()
+        if getattr(self, 'code_list', None) is None:
+            self.code_list = self.codes.select_related('type')
         codes = {}
         for code in self.code_list:
             codes[code.type.code] = code.code
@@ -206,6 +410,65 @@ class Area(models.Model):
             'codes': self.all_codes,
         }
 
+    # All the area's polygons collected together and put into the given
+    # SRID, or None if it has none. This has always used GDAL's own
+    # definitions of the SRIDs, so still does.
+    def collect_polygons(self, srid):
+        all_areas = self.polygons.all()
+        if len(all_areas) > 1:
+            all_areas = all_areas.collect()
+        elif len(all_areas) == 1:
+            all_areas = all_areas[0].polygon
+        else:
+            return None
+        if srid != settings.MAPIT_AREA_SRID:
+            transform(all_areas, srid, database=False)
+        return all_areas
+
+    # The number of parts, extent and centre of the area's polygons, in WGS84
+    # and the national grid, and its area; or None if it has no polygons. See
+    # GeometrySummary for where this is kept.
+    def compute_geometry_summary(self):
+        all_areas = self.collect_polygons(settings.MAPIT_AREA_SRID)
+        if not all_areas:
+            return None
+        out = {
+            'parts': all_areas.num_geom,
+        }
+        if settings.MAPIT_AREA_SRID != 4326:
+            out['srid_en'] = settings.MAPIT_AREA_SRID
+            out['area'] = all_areas.area
+            out['min_e'], out['min_n'], out['max_e'], out['max_n'] = all_areas.extent
+            out['centre_e'], out['centre_n'] = all_areas.centroid
+            transform(all_areas, 4326, database=False)
+            out['min_lon'], out['min_lat'], out['max_lon'], out['max_lat'] = all_areas.extent
+            out['centre_lon'], out['centre_lat'] = all_areas.centroid
+        else:
+            out['min_lon'], out['min_lat'], out['max_lon'], out['max_lat'] = all_areas.extent
+            out['centre_lon'], out['centre_lat'] = all_areas.centroid
+            if hasattr(countries, 'area_geometry_srid'):
+                srid = countries.area_geometry_srid
+                transform(all_areas, srid, database=False)
+                out['srid_en'] = srid
+                out['area'] = all_areas.area
+                out['min_e'], out['min_n'], out['max_e'], out['max_n'] = all_areas.extent
+                out['centre_e'], out['centre_n'] = all_areas.centroid
+        return out
+
+    # As collect_polygons, but simplified to the given tolerance if asked,
+    # using a stored simplified version if there is one
+    def simplified_polygons(self, srid, simplify_tolerance=0):
+        if simplify_tolerance in simplify_tolerances(srid):
+            try:
+                stored = self.simplified.get(srid=srid, tolerance=simplify_tolerance)
+                return GEOSGeometry(stored.polygon)
+            except SimplifiedPolygon.DoesNotExist:
+                pass
+        all_areas = self.collect_polygons(srid)
+        if all_areas is not None and simplify_tolerance:
+            all_areas = all_areas.simplify(simplify_tolerance)
+        return all_areas
+
 class Geometry(models.Model):
     area = models.ForeignKey(Area, related_name='polygons')
     polygon = models.PolygonField(srid=settings.MAPIT_AREA_SRID)
@@ -217,6 +480,87 @@ class Geometry(models.Model):
     def __unicode__(self):
         return u'%s, polygon %d' % (self.area, self.id)
 
+    # Anything worked out from the area's polygons is now out of date
+    def forget_derived(self):
+        SimplifiedPolygon.objects.filter(area=self.area_id).delete()
+        GeometrySummary.objects.filter(area=self.area_id).delete()
+        AreaRelationsFound.objects.forget([ self.area_id ])
+        polygoncache.forget([ self.area_id ])
+        tiles.forget()
+
+    def save(self, *args, **kwargs):
+        super(Geometry, self).save(*args, **kwargs)
+        self.forget_derived()
+
+    def delete(self, *args, **kwargs):
+        self.forget_derived()
+        super(Geometry, self).delete(*args, **kwargs)
+
+class GeometrySummaryManager(models.Manager):
+    def for_areas(self, area_ids):
+        """Returns a dictionary from area ID to geometry summary for the
+        given areas in one query, working out and storing any that haven't
+        been yet. Areas without polygons have a summary of None, which is
+        stored too so it isn't worked out again; areas that don't exist are
+        left out."""
+        out = dict( (s.area_id, simplejson.loads(s.summary)) for s in self.filter(area__in=area_ids) )
+        for area in Area.objects.filter(id__in=[ id for id in area_ids if id not in out ]):
+            summary = area.compute_geometry_summary()
+            # In a savepoint, as with get_or_create, so that if someone else
+            # has just stored it, any transaction this is part of can go on
+            sid = transaction.savepoint()
+            try:
+                self.create(area=area, summary=simplejson.dumps(summary))
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                summary = simplejson.loads(self.get(area=area).summary)
+            out[area.id] = summary
+        return out
+
+# What compute_geometry_summary returns for an area, stored as JSON as it is
+# only ever output as is (null if the area has no polygons). Worked out by
+# save_polygons when polygons are imported, or otherwise the first time it is
+# asked for.
+class GeometrySummary(models.Model):
+    area = models.OneToOneField(Area, related_name='geometry_summary')
+    summary = models.TextField()
+
+    objects = GeometrySummaryManager()
+
+    class Meta:
+        verbose_name_plural = 'geometry summaries'
+
+    def __unicode__(self):
+        return u'%s, geometry summary' % self.area_id
+
+# The tolerances, in the units of each SRID, at which simplified versions of
+# every area's polygons are stored by the simplify_polygons command.
+SIMPLIFY_TOLERANCES = {
+    4326: (0.0001, 0.0005, 0.001, 0.005, 0.01),
+}
+SIMPLIFY_TOLERANCES_METRES = (10, 50, 100, 500, 1000)
+
+def simplify_tolerances(srid):
+    return SIMPLIFY_TOLERANCES.get(srid, SIMPLIFY_TOLERANCES_METRES)
+
+# The SRIDs simplified versions are stored in
+def simplify_srids():
+    return sorted(set([ 4326, settings.MAPIT_AREA_SRID ]))
+
+class SimplifiedPolygon(models.Model):
+    area = models.ForeignKey(Area, related_name='simplified')
+    srid = models.IntegerField()
+    tolerance = models.FloatField()
+    # Stored as hex EWKB, as it may be in any SRID
+    polygon = models.TextField()
+
+    class Meta:
+        unique_together = ('area', 'srid', 'tolerance')
+
+    def __unicode__(self):
+        return u'%s, simplified to %s in %d' % (self.area, self.tolerance, self.srid)
+
 class NameType(models.Model):
     code = models.CharField(max_length=10, unique=True)
     description = models.CharField(max_length=200, blank=True)
@@ -228,6 +572,7 @@ class Name(models.Model):
     area = models.ForeignKey(Area, related_name='names')
     type = models.ForeignKey(NameType, related_name='names')
     name = models.CharField(max_length=100)
+    search_key = models.CharField(max_length=100, editable=False, blank=True, db_index=True) # Set from name, see normalise_name
     objects = Manager()
 
     class Meta:
@@ -260,6 +605,7 @@ class Name(models.Model):
         return n
 
     def save(self, *args, **kwargs):
+        self.search_key = normalise_name(self.name)
         super(Name, self).save(*args, **kwargs)
         try:
             name = self.area.names.filter(type__code__in=('M', 'O', 'S')).order_by('type__code')[0]
@@ -268,18 +614,51 @@ class Name(models.Model):
         except:
             pass
 
+# Code types never change while running, so are kept per process once looked up
+_code_types = {}
+
+class CodeTypeManager(models.Manager):
+    def get_cached(self, code):
+        if code not in _code_types:
+            _code_types[code] = self.get(code=code)
+        return _code_types[code]
+
 class CodeType(models.Model):
     code = models.CharField(max_length=10, unique=True)
     description = models.CharField(max_length=200, blank=True)
 
+    objects = CodeTypeManager()
+
     def __unicode__(self):
         return '%s (%s)' % (self.description, self.code)
 
+# The (code type, code) -> area ID lookup for the current generation, kept
+# per process as a (generation ID, lookup) pair and reloaded when the
+# generation changes. The pair is replaced in one go, so that another thread
+# never sees a half-made one.
+_code_lookup = (None, {})
+
+class CodeManager(Manager):
+    def area_id(self, type, code):
+        """Returns the ID of the area in the current generation with the
+        given code of type (a code type's code), or None if there isn't one,
+        without a query once the lookup has been loaded."""
+        global _code_lookup
+        generation = Generation.objects.current()
+        if not generation: return None
+        generation_id, lookup = _code_lookup
+        if generation_id != generation.id:
+            lookup = dict( ((t, c), id) for t, c, id in self.filter(
+                area__generation_low__lte=generation, area__generation_high__gte=generation
+            ).values_list('type__code', 'code', 'area') )
+            _code_lookup = (generation.id, lookup)
+        return lookup.get( (type, code) )
+
 class Code(models.Model):
     area = models.ForeignKey(Area, related_name='codes')
     type = models.ForeignKey(CodeType, related_name='codes')
     code = models.CharField(max_length=10)
-    objects = Manager()
+    objects = CodeManager()
 
     class Meta:
         unique_together = ('area', 'type')
@@ -295,6 +674,16 @@ class PostcodeManager(GeoManager):
     def __getattr__(self, attr, *args):
         return getattr(self.get_query_set(), attr, *args)
 
+    def add_irish_grid(self, postcodes):
+        """Works out the Irish Grid locations of all the given postcodes at
+        once, so that as_irish_grid doesn't have to do each."""
+        from mapit.transform import transform_points
+        postcodes = [ pc for pc in postcodes if pc.location ]
+        if not postcodes: return
+        grid = transform_points([ pc.location.coords for pc in postcodes ], postcodes[0].location.srid, 29902)
+        for pc, (x, y) in zip(postcodes, grid):
+            pc.irish_grid = [ x, y ]
+
 class Postcode(models.Model):
     postcode = models.CharField(max_length=7, db_index=True, unique=True)
     location = models.PointField(null=True)
@@ -345,11 +734,71 @@ class Postcode(models.Model):
         return result
 
     # Doing this via self.location.transform(29902) gives incorrect results.
-    # The database has the right proj4 text, the proj file does not. I think.
+    # The database has the right proj4 text, the proj file does not. So this
+    # uses a transformation made from the database's definition.
     def as_irish_grid(self):
+        if not hasattr(self, 'irish_grid'):
+            Postcode.objects.add_irish_grid([ self ])
+        return self.irish_grid
+
+# Which areas a postcode is in, as of a particular generation. Filled in in
+# bulk by the find_postcode_areas command, so that postcode lookups don't have
+# to do a point-in-polygon test every time.
+class PostcodeArea(models.Model):
+    postcode = models.ForeignKey(Postcode, related_name='area_memberships')
+    area = models.ForeignKey(Area, related_name='postcode_memberships')
+    generation = models.ForeignKey(Generation, related_name='postcode_memberships')
+
+    class Meta:
+        unique_together = ('generation', 'postcode', 'area')
+
+    def __unicode__(self):
+        return '%s in %s [%s]' % (self.postcode_id, self.area_id, self.generation_id)
+
+# How areas relate to each other in a generation (see RELATION_PATTERNS),
+# stored in bulk by the find_area_relations command so that the touches,
+# overlaps and covers lookups needn't be worked out live. A row means
+# related_area <relation> area, e.g. for 'coveredby', related_area is covered
+# by area.
+class AreaRelation(models.Model):
+    area = models.ForeignKey(Area, related_name='relations')
+    related_area = models.ForeignKey(Area, related_name='related_relations')
+    relation = models.CharField(max_length=10, choices=[ (r, r) for r in sorted(RELATION_PATTERNS) ])
+    generation = models.ForeignKey(Generation, related_name='area_relations')
+
+    class Meta:
+        unique_together = ('generation', 'area', 'relation', 'related_area')
+
+    def __unicode__(self):
+        return '%s %s %s [%s]' % (self.related_area_id, self.relation, self.area_id, self.generation_id)
+
+class AreaRelationsFoundManager(models.Manager):
+    def forget(self, area_ids):
+        """Forgets which areas' relations have been found in any generation
+        one of the given areas is in, as the areas' polygons have changed, so
+        any of those relations may be out of date."""
         cursor = connection.cursor()
-        cursor.execute("SELECT ST_AsText(ST_Transform(ST_GeomFromText('POINT(%f %f)', 4326), 29902))" % (self.location[0], self.location[1]))
-        row = cursor.fetchone()
-        m = re.match('POINT\((.*?) (.*)\)', row[0])
-        return map(float, m.groups())
+        cursor.execute('''
+            DELETE FROM mapit_arearelationsfound WHERE generation_id IN (
+                SELECT mapit_generation.id FROM mapit_generation, mapit_area
+                WHERE mapit_area.id IN %s AND mapit_generation.id >= mapit_area.generation_low_id
+                    AND mapit_generation.id <= mapit_area.generation_high_id
+            )
+        ''', [ tuple(area_ids) ])
+
+# The areas whose relations in a generation have been found and stored by
+# find_area_relations, and when, so that an area without any can be told
+# apart from one whose relations haven't been looked for.
+class AreaRelationsFound(models.Model):
+    area = models.ForeignKey(Area, related_name='relations_found')
+    generation = models.ForeignKey(Generation, related_name='area_relations_found')
+    found = models.DateTimeField(auto_now_add=True)
 
+    objects = AreaRelationsFoundManager()
+
+    class Meta:
+        unique_together = ('generation', 'area')
+        verbose_name_plural = 'area relations found'
+
+    def __unicode__(self):
+        return '%s relations found [%s]' % (self.area_id, self.generation_id)
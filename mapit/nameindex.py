@@ -0,0 +1,60 @@
+# An in-process index of the current generation's area names, for type-ahead
+# lookups. Each worker loads every area's search keys (see normalise_name)
+# once into a sorted list per area type, and can then find the areas with a
+# name starting with some text by bisecting, without going to the database.
+# It is rebuilt when the current generation changes.
+
+from bisect import bisect_left
+
+from mapit.models import Area, Generation, Name
+from mapit.utils import normalise_name
+
+class NameIndex(object):
+    def __init__(self, generation):
+        self.generation = generation.id
+        self.areas = {}
+        keys = {}
+        for id, name, key, type in Area.objects.filter(
+            generation_low__lte=generation, generation_high__gte=generation
+        ).order_by().values_list('id', 'name', 'search_key', 'type__code'):
+            self.areas[id] = (name, type)
+            keys.setdefault(type, []).append( (key, id) )
+        for id, key in Name.objects.filter(
+            area__generation_low__lte=generation, area__generation_high__gte=generation
+        ).values_list('area', 'search_key'):
+            if id in self.areas:
+                keys[self.areas[id][1]].append( (key, id) )
+        self.keys = dict( (type, sorted(set(k))) for type, k in keys.items() )
+
+    def lookup(self, text, types=None, limit=10):
+        """Returns up to limit (area ID, name, type code) tuples of each type
+        in types (or every type) with a name starting with text, in the order
+        of the matching names."""
+        prefix = normalise_name(text)
+        if not prefix: return []
+        out = []
+        for type in sorted(types or self.keys):
+            keys = self.keys.get(type, [])
+            seen = set()
+            i = bisect_left(keys, (prefix,))
+            while i < len(keys) and len(seen) < limit and keys[i][0].startswith(prefix):
+                id = keys[i][1]
+                if id not in seen:
+                    seen.add(id)
+                    out.append( (id,) + self.areas[id] )
+                i += 1
+        return out
+
+_index = None
+
+def get_index():
+    """Returns the name index for the current generation, building it if it
+    hasn't been yet or the generation has changed. Returns None if there is
+    no current generation."""
+    global _index
+    current = Generation.objects.current()
+    if not current:
+        return None
+    if _index is None or _index.generation != current.id:
+        _index = NameIndex(current)
+    return _index
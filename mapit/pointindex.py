@@ -0,0 +1,100 @@
+# An in-process point-in-polygon index of the current generation's
+# geometries. Each worker loads the shapes once into a packed R-tree of
+# prepared geometries, and can then answer "which areas contain this point"
+# without going to PostGIS. Enabled by the MAPIT_POINT_INDEX setting; any
+# lookup it can't answer (e.g. an old generation) goes to the database as
+# before.
+
+import math
+
+from django.conf import settings
+
+from mapit.models import Generation, Geometry
+
+class STRtree(object):
+    """
+    A static R-tree, bulk loaded using the Sort-Tile-Recursive algorithm.
+    Takes a list of (extent, value) pairs, where extent is a (min_x, min_y,
+    max_x, max_y) tuple as returned by a GEOS geometry's extent.
+    """
+    def __init__(self, items, node_capacity=10):
+        self.node_capacity = node_capacity
+        level = [ (extent, True, value) for extent, value in items ]
+        while len(level) > node_capacity:
+            level = self._pack(level)
+        self.root = level
+
+    def _pack(self, entries):
+        n = self.node_capacity
+        slices = int(math.ceil(math.sqrt(math.ceil(len(entries) / float(n)))))
+        per_slice = slices * n
+        entries = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+        parents = []
+        for i in range(0, len(entries), per_slice):
+            strip = sorted(entries[i:i+per_slice], key=lambda e: e[0][1] + e[0][3])
+            for j in range(0, len(strip), n):
+                children = strip[j:j+n]
+                extent = (
+                    min(e[0][0] for e in children), min(e[0][1] for e in children),
+                    max(e[0][2] for e in children), max(e[0][3] for e in children),
+                )
+                parents.append( (extent, False, children) )
+        return parents
+
+    def query(self, x, y):
+        """Returns the values whose extents contain the point (x, y)."""
+        out = []
+        stack = [ self.root ]
+        while stack:
+            for (min_x, min_y, max_x, max_y), leaf, child in stack.pop():
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    if leaf:
+                        out.append(child)
+                    else:
+                        stack.append(child)
+        return out
+
+class PointIndex(object):
+    def __init__(self, generation):
+        self.generation = generation.id
+        shapes = Geometry.objects.filter(
+            area__generation_low__lte=generation, area__generation_high__gte=generation
+        )
+        # Keep hold of the polygon itself, as the prepared geometry refers to it
+        self.tree = STRtree([
+            ( shape.polygon.extent, (shape.area_id, shape.polygon, shape.polygon.prepared) )
+            for shape in shapes
+        ])
+
+    def areas_at(self, location):
+        """Returns the set of IDs of areas that contain location."""
+        if location.srid != settings.MAPIT_AREA_SRID:
+            location = location.transform(settings.MAPIT_AREA_SRID, clone=True)
+        return set(
+            area_id for area_id, polygon, prepared in self.tree.query(location[0], location[1])
+            if prepared.contains(location)
+        )
+
+_index = None
+
+def get_index(generation=None):
+    """
+    Returns the point index for the given generation (a Generation or its
+    ID), or None if the index is turned off or that generation isn't the
+    current one, in which case the caller should ask the database instead.
+    """
+    global _index
+    if not getattr(settings, 'MAPIT_POINT_INDEX', False):
+        return None
+    current = Generation.objects.current()
+    if not current:
+        return None
+    if generation is not None:
+        try:
+            if int(getattr(generation, 'id', generation)) != current.id:
+                return None
+        except (TypeError, ValueError):
+            return None
+    if _index is None or _index.generation != current.id:
+        _index = PointIndex(current)
+    return _index
@@ -0,0 +1,206 @@
+# A cache of areas' rendered polygons on disk, as the outputs for big areas
+# are both the most expensive to make and too large for memcached. Each
+# output is stored gzipped, so it can be sent as it is to anyone accepting
+# gzip - by the web server itself, if it has been set up to send files (see
+# MAPIT_SENDFILE_HEADER) - and is kept in a file named after the area, its
+# polygons' version (the highest ID of them, which changes whenever they are
+# replaced, so an output rendered from the old ones while new ones are being
+# imported is never used), generation, SRID, format and simplification
+# tolerance. Files are touched when used, and once the cache has grown past
+# its size the least recently used are removed. The warm_polygon_cache
+# command can fill it in advance.
+
+import os
+import gzip
+import time
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.db.models import Max
+from django.core.servers.basehttp import FileWrapper
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from mapit.middleware.gzip import accepts_gzip
+
+CONTENT_TYPES = {
+    'kml': 'application/vnd.google-earth.kml+xml',
+    'json': 'application/json',
+    'geojson': 'application/json',
+    'wkt': 'text/plain',
+}
+
+# Only note that a file has been used if it hasn't been for this many seconds,
+# to save writing to the disk on every request for a popular area
+TOUCH_INTERVAL = 3600
+
+# Once the cache is over its size, remove files until it's below this fraction
+# of it, so that it isn't swept again straight away
+SWEEP_TO = 0.9
+
+_written = 0
+
+def cache_dir():
+    return getattr(settings, 'MAPIT_POLYGON_CACHE_DIR', '')
+
+def max_size():
+    return getattr(settings, 'MAPIT_POLYGON_CACHE_SIZE', 1024) * 1024 * 1024
+
+def render_polygon(area, srid, format, simplify_tolerance):
+    """Returns the area's polygons in srid, simplified to simplify_tolerance,
+    as a UTF-8 string in format (kml, json, geojson or wkt), or None if the
+    area has no polygons."""
+    all_areas = area.simplified_polygons(srid, simplify_tolerance)
+    if all_areas is None:
+        return None
+    if format == 'kml':
+        out = u'''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+    <Placemark>
+        <name>%s</name>
+        %s
+    </Placemark>
+</kml>''' % (area.name, all_areas.kml)
+    elif format in ('json', 'geojson'):
+        out = all_areas.json
+    elif format == 'wkt':
+        out = all_areas.wkt
+    if isinstance(out, unicode):
+        out = out.encode('utf-8')
+    return out
+
+def polygons_version(area):
+    """Returns the version of the area's polygons, or None if it has none."""
+    return area.polygons.aggregate(version=Max('id'))['version']
+
+def path(area_id, version, generation_id, srid, format, simplify_tolerance):
+    """Returns the cache file for an output. JSON and GeoJSON are the same,
+    so share a file."""
+    if format == 'geojson': format = 'json'
+    return os.path.join(cache_dir(), str(area_id), '%d-%d-%d-%r.%s.gz' % (
+        version, generation_id, srid, float(simplify_tolerance), format))
+
+def store(filename, content):
+    """Gzips content into filename, atomically, so that another process never
+    sees half a file."""
+    global _written
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass # Made by another process in the meantime
+    fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        out = os.fdopen(fd, 'wb')
+        f = gzip.GzipFile(filename='', mode='wb', fileobj=out)
+        f.write(content)
+        f.close()
+        out.close()
+        os.rename(temp, filename)
+    except:
+        os.unlink(temp)
+        raise
+    _written += os.path.getsize(filename)
+    if _written > max_size() * (1 - SWEEP_TO):
+        sweep()
+
+def touch(filename):
+    try:
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        return False
+    if mtime < time.time() - TOUCH_INTERVAL:
+        try:
+            os.utime(filename, None)
+        except OSError:
+            return False
+    return True
+
+def get(area, generation, srid, format, simplify_tolerance):
+    """Returns the cache file of the area's polygons, rendering and storing
+    them first if need be, or None if the area has no polygons."""
+    version = polygons_version(area)
+    if version is None:
+        return None
+    filename = path(area.id, version, generation.id, srid, format, simplify_tolerance)
+    if touch(filename):
+        return filename
+    content = render_polygon(area, srid, format, simplify_tolerance)
+    if content is None:
+        return None
+    store(filename, content)
+    return filename
+
+def read(filename):
+    """Returns the uncompressed contents of a cache file."""
+    f = gzip.open(filename, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def response(request, filename, format):
+    """Returns a response with the contents of a cache file. Clients that
+    accept gzip are given the file as it is, sent by the web server if it has
+    been set up to; JSONP callbacks need the plain output, as do other
+    clients. Either way, the response isn't also put in the page cache."""
+    content_type = '%s; charset=utf-8' % CONTENT_TYPES[format]
+    request._cache_update_cache = False
+    if not accepts_gzip(request) or request.GET.get('callback'):
+        return HttpResponse(read(filename), content_type=content_type)
+
+    sendfile = getattr(settings, 'MAPIT_SENDFILE_HEADER', '')
+    if sendfile:
+        # The web server fills in the body and its length
+        response = HttpResponse('', content_type=content_type)
+        url = getattr(settings, 'MAPIT_POLYGON_CACHE_URL', '')
+        if url:
+            response[sendfile] = url.rstrip('/') + '/' + os.path.relpath(filename, cache_dir())
+        else:
+            response[sendfile] = filename
+    else:
+        f = open(filename, 'rb')
+        response = HttpResponse(FileWrapper(f), content_type=content_type)
+        response['Content-Length'] = str(os.fstat(f.fileno()).st_size)
+    response.streaming = True
+    response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+def forget(area_ids):
+    """Removes every cached output of the given areas, such as when their
+    polygons have been replaced. This only saves space, as the new polygons
+    have a new version anyway."""
+    if not cache_dir(): return
+    for area_id in area_ids:
+        shutil.rmtree(os.path.join(cache_dir(), str(area_id)), ignore_errors=True)
+
+def sweep():
+    """Removes the least recently used files until the cache is comfortably
+    under its size."""
+    global _written
+    _written = 0
+    files = []
+    total = 0
+    for directory, dirs, filenames in os.walk(cache_dir()):
+        for filename in filenames:
+            filename = os.path.join(directory, filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            files.append( (stat.st_mtime, stat.st_size, filename) )
+            total += stat.st_size
+    if total <= max_size():
+        return
+    files.sort()
+    for mtime, size, filename in files:
+        if total <= max_size() * SWEEP_TO:
+            break
+        try:
+            os.unlink(filename)
+        except OSError:
+            continue
+        total -= size
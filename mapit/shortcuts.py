@@ -63,6 +63,46 @@ def output_json(out, code=200):
     simplejson.dump(out, response, ensure_ascii=False, cls=GEOS_JSONEncoder, indent=indent)
     return response
 
+# Roughly how much JSON to build up before passing it on when streaming
+STREAM_CHUNK_SIZE = 65536
+
+def output_json_stream(pairs):
+    """Like output_json, but for a dictionary given as an iterator of (key,
+    value) pairs, such as a lot of areas. The JSON is generated bit by bit as
+    the response is sent, rather than all being built in memory first. The
+    response is marked as streaming, so that our middleware leaves it as an
+    iterator."""
+    response = http.HttpResponse(json_stream(pairs), content_type='application/json; charset=utf-8')
+    response['Access-Control-Allow-Origin'] = '*'
+    response.streaming = True
+    return response
+
+def json_stream(pairs):
+    """Yields the JSON of a dictionary of the given pairs in chunks, laid out
+    as output_json would, so indented when debugging."""
+    if settings.DEBUG:
+        encoder = GEOS_JSONEncoder(ensure_ascii=False, indent=4)
+        newline, end = u'\n    ', u'\n}'
+    else:
+        encoder = GEOS_JSONEncoder(ensure_ascii=False)
+        newline, end = u'', u'}'
+    chunk, size, separator = [ u'{' ], 0, newline
+    def encode(key, value):
+        return u'%s%s%s%s' % (separator, encoder.encode(unicode(key)), encoder.key_separator,
+            encoder.encode(value).replace(u'\n', newline))
+    for key, value in pairs:
+        item = encode(key, value)
+        separator = encoder.item_separator + newline
+        chunk.append(item)
+        size += len(item)
+        if size >= STREAM_CHUNK_SIZE:
+            yield u''.join(chunk).encode('utf-8')
+            chunk, size = [], 0
+    if settings.DEBUG:
+        chunk.append(encode('debug_db_queries', connection.queries))
+    chunk.append(end)
+    yield u''.join(chunk).encode('utf-8')
+
 def get_object_or_404(klass, format='json', *args, **kwargs):
     try:
         return orig_get_object_or_404(klass, *args, **kwargs)
@@ -0,0 +1,17 @@
+# Django only looks for tests in mapit.tests itself, so each module's tests
+# are brought in here.
+
+from mapit.tests.cache import *
+from mapit.tests.codes import *
+from mapit.tests.generations import *
+from mapit.tests.geometry import *
+from mapit.tests.intersect import *
+from mapit.tests.nameindex import *
+from mapit.tests.names import *
+from mapit.tests.pointindex import *
+from mapit.tests.points import *
+from mapit.tests.polygoncache import *
+from mapit.tests.relations import *
+from mapit.tests.postcodes import *
+from mapit.tests.tiles import *
+from mapit.tests.transform import *
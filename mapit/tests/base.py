@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.contrib.gis.geos import Point, Polygon
+
+from mapit.models import Area, Generation, Geometry, Type
+
+def square(x, y, size):
+    """A square on the British National Grid, in kilometres from (400km,
+    300km), in the areas' SRID."""
+    x, y, size = 400000 + x * 1000, 300000 + y * 1000, size * 1000
+    polygon = Polygon(((x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)), srid=27700)
+    polygon.transform(settings.MAPIT_AREA_SRID)
+    return polygon
+
+def point(x, y):
+    """A point on the same grid as square's, in the areas' SRID."""
+    location = Point(400000 + x * 1000, 300000 + y * 1000, srid=27700)
+    location.transform(settings.MAPIT_AREA_SRID)
+    return location
+
+class AreaTestMixin(object):
+    """Makes an active generation, and areas in it, for tests to use."""
+    def setUp(self):
+        super(AreaTestMixin, self).setUp()
+        self.generation = Generation.objects.create(active=True, description='Test generation')
+        self.type = Type.objects.create(code='TST', description='Test areas')
+
+    def make_area(self, name, *polygons, **kwargs):
+        generation = kwargs.get('generation', self.generation)
+        area = Area.objects.create(name=name, type=self.type,
+            generation_low=generation, generation_high=generation)
+        for polygon in polygons:
+            Geometry.objects.create(area=area, polygon=polygon)
+        return area
@@ -0,0 +1,192 @@
+import gzip
+from cStringIO import StringIO
+
+from django.core.cache import get_cache
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
+
+from mapit.middleware import cache as cache_middleware
+from mapit.middleware.gzip import GZipMiddleware
+from mapit.models import Area, Code, CodeType
+from mapit.views.areas import areas_by_type, iter_with_codes
+from mapit.tests.base import AreaTestMixin
+
+class PageCacheTestCase(TestCase):
+    """Runs requests through the cache middleware, and the gzip middleware
+    that comes after it, with a local memory cache in place of memcached."""
+    def setUp(self):
+        self.shared = get_cache('locmem://')
+        self.shared.clear()
+        self.original_cache = cache_middleware.page_cache
+        cache_middleware.page_cache = self.shared
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        cache_middleware.page_cache = self.original_cache
+
+    def request(self, view, path='/test', **headers):
+        """Returns the response to a request as sent, and whether it came
+        from the cache."""
+        request = self.factory.get(path, **headers)
+        fetch = cache_middleware.FetchFromCacheMiddleware()
+        fetch.cache_anonymous_only = False
+        response = fetch.process_request(request)
+        cached = response is not None
+        if not cached:
+            response = view(request)
+            update = cache_middleware.UpdateCacheMiddleware()
+            update.cache_timeout = 60
+            response = update.process_response(request, response)
+        response = GZipMiddleware().process_response(request, response)
+        return response, ''.join(response), cached
+
+def streamed_view(request):
+    response = HttpResponse(iter([ 'streamed ' * 100, 'content' ]), content_type='text/plain')
+    response.streaming = True
+    return response
+
+class StreamedResponseTest(PageCacheTestCase):
+    def test_cached_headers_match_cached_body(self):
+        response, content, cached = self.request(streamed_view, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(cached)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        # The copy in the cache is the uncompressed body, so mustn't say it is
+        # gzipped; the gzip middleware compresses it again if asked
+        response, content, cached = self.request(streamed_view)
+        self.assertTrue(cached)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(content, 'streamed ' * 100 + 'content')
+
+class StreamedAreasTest(AreaTestMixin, PageCacheTestCase):
+    def setUp(self):
+        super(StreamedAreasTest, self).setUp()
+        self.ids = sorted( self.make_area('Area %d' % i).id for i in range(5) )
+        code_type = CodeType.objects.create(code='tst', description='Test codes')
+        for id in self.ids:
+            Code.objects.create(area_id=id, type=code_type, code='C%d' % id)
+
+    def test_fetched_in_chunks(self):
+        areas = Area.objects.filter(type=self.type)
+        for chunk_size in (1, 2, 5, 10):
+            streamed = list(iter_with_codes(areas, chunk_size))
+            self.assertEqual([ area.id for area in streamed ], self.ids)
+            self.assertEqual([ area.all_codes for area in streamed ], [ { 'tst': 'C%d' % id } for id in self.ids ])
+        # Each chunk of areas, and then its codes
+        self.assertNumQueries(6, lambda: list(iter_with_codes(areas, 2)))
+
+    def test_through_middleware(self):
+        view = lambda request: areas_by_type(request, 'TST')
+        response, content, cached = self.request(view, '/areas/TST')
+        self.assertFalse(cached)
+        self.assertEqual(sorted(map(int, simplejson.loads(content))), self.ids)
+
+        response, content, cached = self.request(view, '/areas/TST', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(cached)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.GzipFile(fileobj=StringIO(content)).read()
+        self.assertEqual(sorted(map(int, simplejson.loads(content))), self.ids)
+
+class ChunkedStorageTest(PageCacheTestCase):
+    def setUp(self):
+        super(ChunkedStorageTest, self).setUp()
+        self.original_chunk_size = cache_middleware.CHUNK_SIZE
+        cache_middleware.CHUNK_SIZE = 100
+        # Doesn't compress to under a chunk
+        self.content = ''.join([ str(i * 7919 % 10007) for i in range(1000) ])
+
+    def tearDown(self):
+        cache_middleware.CHUNK_SIZE = self.original_chunk_size
+        super(ChunkedStorageTest, self).tearDown()
+
+    def test_large_response_is_chunked(self):
+        headers = [ ('Content-Type', 'text/plain'), ('X-Test', 'yes') ]
+        cache_middleware.store_response('key', 200, headers, self.content, 60)
+        manifest = self.shared.get('key')
+        self.assertTrue(len(manifest['chunks']) > 1)
+        self.assertFalse('content' in manifest)
+
+        response = cache_middleware.fetch_response('key')
+        self.assertEqual(response.content, self.content)
+        self.assertEqual(response['X-Test'], 'yes')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+
+    def test_missing_chunk_is_a_miss(self):
+        cache_middleware.store_response('key', 200, [], self.content, 60)
+        self.shared.delete(self.shared.get('key')['chunks'][-1])
+        self.assertEqual(cache_middleware.fetch_response('key'), None)
+
+    def test_small_response_is_stored_compressed(self):
+        cache_middleware.store_response('key', 200, [], 'small', 60)
+        manifest = self.shared.get('key')
+        self.assertTrue(manifest['compressed'])
+        self.assertNotEqual(manifest['content'], 'small')
+        self.assertEqual(cache_middleware.fetch_response('key').content, 'small')
+
+    def test_encoded_response_is_stored_as_is(self):
+        cache_middleware.store_response('key', 200, [ ('Content-Encoding', 'gzip') ], 'gzipped', 60)
+        manifest = self.shared.get('key')
+        self.assertFalse(manifest['compressed'])
+        self.assertEqual(manifest['content'], 'gzipped')
+
+    def test_old_style_entry_is_a_miss(self):
+        self.shared.set('key', HttpResponse('pickled'))
+        self.assertEqual(cache_middleware.fetch_response('key'), None)
+
+    def test_large_page_is_served_from_cache(self):
+        view = lambda request: HttpResponse(self.content, content_type='text/plain')
+        response, content, cached = self.request(view)
+        self.assertFalse(cached)
+        response, content, cached = self.request(view)
+        self.assertTrue(cached)
+        self.assertEqual(content, self.content)
+
+class LocalCacheTest(PageCacheTestCase):
+    def setUp(self):
+        super(LocalCacheTest, self).setUp()
+        self.local = cache_middleware.LocalCache(self.shared, 1000, 60)
+
+    def test_hits_and_misses(self):
+        self.shared.set('key', 'value')
+        self.assertEqual(self.local.get('key'), 'value')
+        self.shared.set('key', 'changed')
+        self.assertEqual(self.local.get('key'), 'value')
+        self.assertEqual(self.local.get('missing', 'default'), 'default')
+        stats = self.local.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_set_writes_through(self):
+        self.local.set('key', 'value', 60)
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.local.get('key'), 'value')
+        self.assertEqual(self.local.hits, 1)
+
+    def test_entries_expire(self):
+        self.local.set('key', 'value', 60)
+        self.local.entries['key'] = (0,) + self.local.entries['key'][1:]
+        self.shared.set('key', 'changed')
+        self.assertEqual(self.local.get('key'), 'changed')
+        self.assertEqual(self.local.misses, 1)
+
+    def test_least_recently_used_are_evicted(self):
+        for i in range(10):
+            self.local.set('key%d' % i, 'x' * 200, 60)
+            self.local.get('key0')
+        self.assertTrue(self.local.size <= 1000)
+        self.assertTrue('key0' in self.local.entries)
+        self.assertFalse('key1' in self.local.entries)
+
+    def test_large_values_are_not_kept(self):
+        self.local.set('key', 'x' * 500, 60)
+        self.assertFalse('key' in self.local.entries)
+        self.assertEqual(self.local.get('key'), 'x' * 500)
+
+    def test_stats_view(self):
+        from mapit.views.cache import cache_stats
+        cache_middleware.page_cache = self.local
+        self.local.get('key')
+        response = cache_stats(self.factory.get('/cache/stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('"misses": 1' in response.content)
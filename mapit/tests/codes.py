@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.test import TestCase
+from django.utils.unittest import skipUnless
+
+from mapit import models
+from mapit.models import Code, CodeType, Generation
+from mapit.tests.base import AreaTestMixin
+
+class CodeLookupTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(CodeLookupTest, self).setUp()
+        models._code_lookup = (None, {})
+        models._code_types.clear()
+        self.ons = CodeType.objects.create(code='ons', description='ONS')
+        self.gss = CodeType.objects.create(code='gss', description='GSS')
+        self.area = self.make_area('Coded')
+        self.area.codes.create(type=self.ons, code='00AB')
+        self.area.codes.create(type=self.gss, code='E09000002')
+
+    def tearDown(self):
+        models._code_lookup = (None, {})
+        models._code_types.clear()
+        super(CodeLookupTest, self).tearDown()
+
+    def test_area_id(self):
+        self.assertEqual(Code.objects.area_id('ons', '00AB'), self.area.id)
+        self.assertEqual(Code.objects.area_id('gss', 'E09000002'), self.area.id)
+        self.assertEqual(Code.objects.area_id('gss', '00AB'), None)
+        self.assertEqual(Code.objects.area_id('ons', '00AC'), None)
+
+    def test_reloaded_for_new_generation(self):
+        Code.objects.area_id('ons', '00AB')
+        new = Generation.objects.create(active=True, description='New generation')
+        later = self.make_area('Later', generation=new)
+        later.codes.create(type=self.ons, code='00AC')
+        self.assertEqual(Code.objects.area_id('ons', '00AC'), later.id)
+        self.assertEqual(Code.objects.area_id('ons', '00AB'), None)
+
+    @skipUnless(settings.MAPIT_COUNTRY == 'GB', 'needs GB codes')
+    def test_area_code_lookup(self):
+        from mapit.countries import gb
+        self.assertEqual(gb.area_code_lookup('00AB', 'json', inline=True), self.area.id)
+        self.assertEqual(gb.area_code_lookup('E09000002', 'json')['Location'], '/area/%d.json' % self.area.id)
+        self.assertEqual(gb.area_code_lookup('1234', 'json'), None)
+        self.assertEqual(gb.area_code_lookup('00AC', 'json').status_code, 404)
+        # Codes of areas not in the current generation are looked up as before
+        Generation.objects.create(active=True, description='New generation')
+        self.assertEqual(gb.area_code_lookup('00AB', 'json', inline=True), self.area.id)
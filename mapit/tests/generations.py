@@ -0,0 +1,40 @@
+from django.core.cache import get_cache
+from django.test import TestCase
+
+from mapit import models
+from mapit.models import Generation
+
+class GenerationCacheTest(TestCase):
+    def setUp(self):
+        self.original_cache = models.cache
+        models.cache = get_cache('locmem://')
+        models.cache.clear()
+        Generation.objects.invalidate()
+        self.current = Generation.objects.create(active=True, description='Current')
+        self.new = Generation.objects.create(active=False, description='New')
+
+    def tearDown(self):
+        models.cache = self.original_cache
+        Generation.objects.invalidate()
+
+    def test_lookups_are_cached(self):
+        self.assertEqual(Generation.objects.current(), self.current)
+        self.assertEqual(Generation.objects.new(), self.new)
+        self.assertNumQueries(0, Generation.objects.current)
+        self.assertNumQueries(0, Generation.objects.new)
+
+    def test_changing_a_returned_generation_does_not_change_the_cache(self):
+        new = Generation.objects.new()
+        new.active = True
+        new.description = 'Changed'
+        self.assertFalse(Generation.objects.new().active)
+        self.assertEqual(Generation.objects.new().description, 'New')
+        self.assertEqual(Generation.objects.current().id, self.current.id)
+
+    def test_saving_looks_again(self):
+        Generation.objects.current()
+        new = Generation.objects.new()
+        new.active = True
+        new.save()
+        self.assertEqual(Generation.objects.current().id, self.new.id)
+        self.assertEqual(Generation.objects.new(), None)
@@ -0,0 +1,51 @@
+from django.test import TestCase
+
+from mapit.models import GeometrySummary
+from mapit.tests.base import AreaTestMixin, square
+
+class GeometrySummaryTest(AreaTestMixin, TestCase):
+    def test_stored_matches_live(self):
+        area = self.make_area('Squares', square(0, 0, 10), square(20, 0, 10))
+        summary = GeometrySummary.objects.for_areas([ area.id ])[area.id]
+        self.assertTrue(GeometrySummary.objects.filter(area=area).exists())
+        self.assertEqual(GeometrySummary.objects.for_areas([ area.id ])[area.id], summary)
+        live = area.compute_geometry_summary()
+        self.assertEqual(sorted(summary), sorted(live))
+        self.assertEqual(summary['parts'], 2)
+        for key, value in live.items():
+            self.assertAlmostEqual(summary[key], value, 9, key)
+
+    def test_matches_geos_transform(self):
+        # /area/<id>/geometry has always transformed with GEOSGeometry.transform
+        area = self.make_area('Square', square(0, 0, 10))
+        summary = GeometrySummary.objects.for_areas([ area.id ])[area.id]
+        polygon = area.polygons.all()[0].polygon
+        polygon.transform(4326)
+        self.assertAlmostEqual(summary['centre_lon'], polygon.centroid.x, 9)
+        self.assertAlmostEqual(summary['centre_lat'], polygon.centroid.y, 9)
+        self.assertAlmostEqual(summary['min_lon'], polygon.extent[0], 9)
+        self.assertAlmostEqual(summary['max_lat'], polygon.extent[3], 9)
+
+    def test_no_polygons(self):
+        area = self.make_area('Empty')
+        self.assertEqual(GeometrySummary.objects.for_areas([ area.id, area.id + 1 ]), { area.id: None })
+        self.assertEqual(GeometrySummary.objects.get(area=area).summary, 'null')
+
+    def test_stored_meanwhile(self):
+        # If someone else stores the summary between it being looked for and
+        # stored, theirs is used, and the transaction carries on
+        area = self.make_area('Square', square(0, 0, 10))
+        GeometrySummary.objects.create(area=area, summary='{"parts": 1}')
+        manager = GeometrySummary.objects
+        manager.filter = lambda **kwargs: manager.none()
+        try:
+            self.assertEqual(manager.for_areas([ area.id ]), { area.id: { 'parts': 1 } })
+        finally:
+            del manager.filter
+        self.assertEqual(GeometrySummary.objects.count(), 1)
+
+    def test_replacing_polygons_forgets(self):
+        area = self.make_area('Square', square(0, 0, 10))
+        GeometrySummary.objects.for_areas([ area.id ])
+        area.polygons.all()[0].delete()
+        self.assertFalse(GeometrySummary.objects.filter(area=area).exists())
@@ -0,0 +1,52 @@
+from django.test import TestCase
+
+from mapit.models import Area, Generation, Geometry, Type
+from mapit.tests.base import AreaTestMixin, square
+
+class IntersectTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(IntersectTest, self).setUp()
+        self.target = self.make_area('Target', square(0, 0, 10), square(20, 0, 10))
+        self.make_area('Touching', square(10, 0, 5))
+        self.make_area('Inside', square(22, 2, 2))
+        self.make_area('Across', square(25, 5, 10))
+        self.make_area('Covering', square(-5, -5, 50))
+        self.make_area('Far', square(100, 100, 5))
+        other_type = Type.objects.create(code='OTH', description='Other areas')
+        Area.objects.create(name='Other type', type=other_type,
+            generation_low=self.generation, generation_high=self.generation
+        ).polygons.create(polygon=square(2, 2, 2))
+        old = Generation.objects.create(active=False, description='Old generation')
+        self.make_area('Old', square(2, 2, 2), generation=old)
+
+    def expected(self, relation, types=None):
+        """What GeoDjango's own lookups find, one polygon at a time."""
+        polygons = Geometry.objects.filter(
+            area__generation_low__lte=self.generation, area__generation_high__gte=self.generation,
+            **{ 'polygon__%s' % relation: self.target.polygons.collect() }
+        ).exclude(area=self.target)
+        if types:
+            polygons = polygons.filter(area__type__code__in=types)
+        return sorted(set(polygons.values_list('area', flat=True)))
+
+    def names(self, ids):
+        return sorted( area.name for area in Area.objects.filter(id__in=ids) )
+
+    def test_matches_geometry_lookups(self):
+        for relation in ('touches', 'overlaps', 'covers', 'coveredby'):
+            for types in (None, [ 'TST' ], [ 'OTH' ], [ 'TST', 'OTH' ]):
+                self.assertEqual(
+                    sorted(Area.objects.intersect_ids(relation, self.target, types, self.generation)),
+                    self.expected(relation, types), (relation, types))
+
+    def test_lookups(self):
+        lookup = lambda relation, types=None: self.names(Area.objects.intersect_ids(relation, self.target, types, self.generation))
+        self.assertEqual(lookup('touches'), [ 'Touching' ])
+        self.assertEqual(lookup('overlaps'), [ 'Across' ])
+        self.assertEqual(lookup('covers'), [ 'Covering' ])
+        self.assertEqual(lookup('coveredby'), [ 'Inside', 'Other type' ])
+        self.assertEqual(lookup('coveredby', [ 'TST' ]), [ 'Inside' ])
+
+    def test_several_relations(self):
+        both = Area.objects.intersect_ids([ 'overlaps', 'coveredby' ], self.target, None, self.generation)
+        self.assertEqual(sorted(both), sorted(set(self.expected('overlaps') + self.expected('coveredby'))))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
+
+from mapit import nameindex
+from mapit.models import Area, Generation, Name, NameType, Type
+from mapit.views.areas import areas_autocomplete
+from mapit.tests.base import AreaTestMixin
+
+class NameIndexTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(NameIndexTest, self).setUp()
+        nameindex._index = None
+        self.other_type = Type.objects.create(code='OTH', description='Other areas')
+        self.bournemouth = self.make_area(u'Bournemouth')
+        self.bourne = self.make_area(u'Bourne End')
+        self.borough = Area.objects.create(name=u'Bournville Borough', type=self.other_type,
+            generation_low=self.generation, generation_high=self.generation)
+        self.ynys = self.make_area(u'Ynys Môn')
+        Name.objects.create(area=self.ynys, type=NameType.objects.create(code='X', description='Other names'), name='Isle of Anglesey')
+        old = Generation.objects.create(active=False, description='Old generation')
+        self.make_area(u'Bournbrook', generation=old)
+
+    def tearDown(self):
+        nameindex._index = None
+        super(NameIndexTest, self).tearDown()
+
+    def ids(self, text, types=None, limit=10):
+        return [ id for id, name, type in nameindex.get_index().lookup(text, types, limit) ]
+
+    def test_prefix(self):
+        self.assertEqual(self.ids('Bourn'), [ self.borough.id, self.bourne.id, self.bournemouth.id ])
+        self.assertEqual(self.ids('bourne e'), [ self.bourne.id ])
+        self.assertEqual(self.ids('ourne'), [])
+        self.assertEqual(self.ids(''), [])
+
+    def test_names_and_normalisation(self):
+        self.assertEqual(self.ids('ynys mo'), [ self.ynys.id ])
+        self.assertEqual(self.ids('isle-of'), [ self.ynys.id ])
+        self.assertEqual(nameindex.get_index().lookup('ISLE', None, 10), [ (self.ynys.id, u'Ynys Môn', 'TST') ])
+
+    def test_types_and_limit(self):
+        self.assertEqual(self.ids('Bourn', [ 'TST' ]), [ self.bourne.id, self.bournemouth.id ])
+        self.assertEqual(self.ids('Bourn', [ 'TST' ], 1), [ self.bourne.id ])
+        self.assertEqual(self.ids('Bourn', [ 'NON' ]), [])
+
+    def test_rebuilt_for_new_generation(self):
+        index = nameindex.get_index()
+        self.assertTrue(nameindex.get_index() is index)
+        new = Generation.objects.create(active=True, description='New generation')
+        self.make_area('Bourne Valley', generation=new)
+        self.assertEqual(nameindex.get_index().generation, new.id)
+        self.assertEqual(len(self.ids('Bourn')), 1)
+
+    def test_view(self):
+        request = RequestFactory().get('/areas/autocomplete', { 'q': 'bourn', 'type': 'TST,OTH', 'limit': '1' })
+        out = simplejson.loads(areas_autocomplete(request).content)
+        self.assertEqual(out, [
+            { 'id': self.borough.id, 'name': 'Bournville Borough', 'type': 'OTH' },
+            { 'id': self.bourne.id, 'name': 'Bourne End', 'type': 'TST' },
+        ])
+        request = RequestFactory().get('/areas/autocomplete', { 'q': 'bourn', 'limit': 'x' })
+        self.assertEqual(areas_autocomplete(request).status_code, 400)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
+
+from mapit.models import Area, Generation, Name, NameType, Type
+from mapit.views.areas import areas_by_name
+from mapit.tests.base import AreaTestMixin
+
+class NameSearchTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(NameSearchTest, self).setUp()
+        self.name_type = NameType.objects.create(code='X', description='Other names')
+        self.ystrad = self.make_area(u'Ystrad Mynach')
+        self.ynys = self.make_area(u'Ynys Môn')
+        Name.objects.create(area=self.ynys, type=self.name_type, name='Isle of Anglesey')
+        self.st_albans = self.make_area(u"St. Alban's")
+
+    def search(self, name, **kwargs):
+        return sorted(Area.objects.filter_by_name(name, **kwargs).values_list('id', flat=True))
+
+    def test_prefix(self):
+        self.assertEqual(self.search('Y'), sorted([ self.ystrad.id, self.ynys.id ]))
+        self.assertEqual(self.search('Ystrad'), [ self.ystrad.id ])
+        self.assertEqual(self.search('strad'), [])
+
+    def test_other_names(self):
+        self.assertEqual(self.search('Isle of'), [ self.ynys.id ])
+
+    def test_case_accents_and_punctuation(self):
+        self.assertEqual(self.search('ynys mon'), [ self.ynys.id ])
+        self.assertEqual(self.search(u'YNYS MÔN'), [ self.ynys.id ])
+        self.assertEqual(self.search('st albans'), [ self.st_albans.id ])
+        self.assertEqual(self.search("St. Alban's"), [ self.st_albans.id ])
+        self.assertEqual(self.search('isle-of-anglesey'), [ self.ynys.id ])
+
+    def test_nothing_to_search_for(self):
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('...'), [])
+
+    def test_filtered_in_the_database(self):
+        other_type = Type.objects.create(code='OTH', description='Other areas')
+        Area.objects.create(name='Ystradgynlais', type=other_type,
+            generation_low=self.generation, generation_high=self.generation)
+        old = Generation.objects.create(active=False, description='Old generation')
+        self.make_area('Ystalyfera', generation=old)
+        self.assertEqual(sorted(Area.objects.filter_by_name('Yst').filter(
+            type=self.type, generation_low__lte=self.generation, generation_high__gte=self.generation
+        ).values_list('id', flat=True)), [ self.ystrad.id ])
+
+    def test_view(self):
+        request = RequestFactory().get('/areas/ynys mon', { 'type': 'TST' })
+        response = areas_by_name(request, 'ynys mon')
+        self.assertEqual(simplejson.loads(response.content).keys(), [ str(self.ynys.id) ])
+
+    def test_fuzzy(self):
+        if not Area.objects.fuzzy_search_available():
+            return
+        fuzzy = lambda name: [ area.id for area in Area.objects.filter_by_name(name, fuzzy=True) ]
+        self.assertEqual(fuzzy('Ystrad Mynch'), [ self.ystrad.id ])
+        # Most similar first, by any of an area's names
+        near = self.make_area(u'Isle of Anglesea')
+        self.assertEqual(fuzzy('Isle of Anglesey'), [ self.ynys.id, near.id ])
@@ -0,0 +1,88 @@
+import random
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.test import TestCase
+
+from mapit import pointindex
+from mapit.models import Area, Generation
+from mapit.pointindex import STRtree
+from mapit.tests.base import AreaTestMixin, square, point
+
+class STRtreeTest(TestCase):
+    def test_matches_brute_force(self):
+        random.seed(0)
+        items = []
+        for i in range(500):
+            x, y = random.uniform(0, 100), random.uniform(0, 100)
+            items.append( ((x, y, x + random.uniform(0, 10), y + random.uniform(0, 10)), i) )
+        tree = STRtree(items)
+        for i in range(200):
+            x, y = random.uniform(0, 110), random.uniform(0, 110)
+            expected = [ v for (min_x, min_y, max_x, max_y), v in items
+                if min_x <= x <= max_x and min_y <= y <= max_y ]
+            self.assertEqual(sorted(tree.query(x, y)), expected)
+
+class PointIndexTest(AreaTestMixin, TestCase):
+    """The index must find just the areas the database would."""
+    def setUp(self):
+        super(PointIndexTest, self).setUp()
+        self.original = getattr(settings, 'MAPIT_POINT_INDEX', False)
+        pointindex._index = None
+        holed = Polygon(square(0, 0, 10).exterior_ring, square(3, 3, 4).exterior_ring)
+        holed.srid = settings.MAPIT_AREA_SRID
+        self.holed = self.make_area('Holed', holed)
+        self.parts = self.make_area('Two parts', square(20, 0, 5), square(30, 0, 5))
+        self.overlapping = self.make_area('Overlapping', square(5, 0, 20))
+        # Enough areas that the tree has more than one level
+        self.small = [ self.make_area('Small %d' % i, square(i * 2, 40, 1)) for i in range(25) ]
+        old = Generation.objects.create(active=False, description='Old generation')
+        self.old = self.make_area('Old', square(0, 0, 50), generation=old)
+        self.old_generation = old
+
+    def tearDown(self):
+        settings.MAPIT_POINT_INDEX = self.original
+        pointindex._index = None
+        super(PointIndexTest, self).tearDown()
+
+    def lookup(self, location, use_index, generation=None):
+        settings.MAPIT_POINT_INDEX = use_index
+        self.assertEqual(pointindex.get_index(self.generation) is not None, use_index)
+        return sorted( area.id for area in Area.objects.by_location(location, generation or self.generation) )
+
+    def areas_at(self, x, y):
+        location = point(x, y)
+        expected = self.lookup(location, False)
+        self.assertEqual(self.lookup(location, True), expected, (x, y))
+        return expected
+
+    def test_inside_and_outside(self):
+        self.assertEqual(self.areas_at(1, 1), [ self.holed.id ])
+        self.assertEqual(self.areas_at(8, 1), sorted([ self.holed.id, self.overlapping.id ]))
+        self.assertEqual(self.areas_at(100, 100), [])
+
+    def test_hole(self):
+        self.assertEqual(self.areas_at(4, 4), [])
+        self.assertEqual(self.areas_at(6, 6), [ self.overlapping.id ])
+
+    def test_boundaries(self):
+        for x, y in ((0, 5), (3, 5), (7, 4), (10, 5), (5, 20), (20, 0), (25, 2)):
+            self.areas_at(x, y)
+
+    def test_several_polygons(self):
+        self.assertEqual(self.areas_at(22, 2), sorted([ self.parts.id, self.overlapping.id ]))
+        self.assertEqual(self.areas_at(32, 2), [ self.parts.id ])
+        self.assertEqual(self.areas_at(27, 2), [])
+
+    def test_many_areas(self):
+        for i, area in enumerate(self.small):
+            self.assertEqual(self.areas_at(i * 2 + 0.5, 40.5), [ area.id ])
+            self.assertEqual(self.areas_at(i * 2 + 1.5, 40.5), [])
+
+    def test_generations(self):
+        # Only the current generation's areas are in the index; others are
+        # looked up in the database
+        self.assertFalse(self.old.id in self.areas_at(45, 45))
+        settings.MAPIT_POINT_INDEX = True
+        self.assertEqual(pointindex.get_index(self.old_generation), None)
+        self.assertEqual([ area.id for area in Area.objects.by_location(point(45, 45), self.old_generation) ], [ self.old.id ])
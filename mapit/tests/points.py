@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
+
+from mapit import pointindex
+from mapit.views.areas import areas_by_points, MAX_POINTS
+from mapit.tests.base import AreaTestMixin, square
+
+class PointsLookupTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(PointsLookupTest, self).setUp()
+        self.original = getattr(settings, 'MAPIT_POINT_INDEX', False)
+        pointindex._index = None
+        self.big = self.make_area('Big', square(0, 0, 10))
+        self.inside = self.make_area('Inside', square(2, 2, 2))
+
+    def tearDown(self):
+        settings.MAPIT_POINT_INDEX = self.original
+        pointindex._index = None
+        super(PointsLookupTest, self).tearDown()
+
+    def post(self, points, **kwargs):
+        kwargs['points'] = points
+        request = RequestFactory().post('/points/27700', kwargs)
+        return areas_by_points(request, '27700')
+
+    def lookup(self, points):
+        response = self.post(points)
+        self.assertEqual(response.status_code, 200)
+        return [ sorted(map(int, areas)) for areas in simplejson.loads(response.content) ]
+
+    def test_lookup(self):
+        # Points on the British National Grid, in the order given
+        expected = [ sorted([ self.big.id, self.inside.id ]), [ self.big.id ], [], [ self.big.id ] ]
+        points = '403000,303000; 408000,308000\n450000,350000 401000,309000'
+        self.assertEqual(self.lookup(points), expected)
+        settings.MAPIT_POINT_INDEX = True
+        self.assertEqual(self.lookup(points), expected)
+
+    def test_area_details(self):
+        response = simplejson.loads(self.post('403000,303000', type='TST').content)
+        self.assertEqual(response[0][str(self.inside.id)]['name'], 'Inside')
+
+    def test_type_filter(self):
+        self.type.code = 'OTH'
+        self.type.save()
+        self.assertEqual(simplejson.loads(self.post('403000,303000', type='TST').content), [ {} ])
+
+    def test_errors(self):
+        self.assertEqual(areas_by_points(RequestFactory().get('/points/27700'), '27700').status_code, 400)
+        for points in ('', 'a,b', '1,2,3', '1,2;3'):
+            self.assertEqual(self.post(points).status_code, 400, points)
+        self.assertEqual(self.post(' '.join([ '1,2' ] * (MAX_POINTS + 1))).status_code, 400)
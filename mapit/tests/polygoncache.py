@@ -0,0 +1,98 @@
+import os
+import gzip
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from mapit import polygoncache
+from mapit.tests.base import AreaTestMixin, square
+
+class PolygonCacheTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(PolygonCacheTest, self).setUp()
+        self.original_settings = dict( (name, getattr(settings, name, None)) for name in
+            ('MAPIT_POLYGON_CACHE_DIR', 'MAPIT_POLYGON_CACHE_SIZE', 'MAPIT_SENDFILE_HEADER', 'MAPIT_POLYGON_CACHE_URL') )
+        self.dir = tempfile.mkdtemp()
+        settings.MAPIT_POLYGON_CACHE_DIR = self.dir
+        settings.MAPIT_POLYGON_CACHE_SIZE = 1
+        settings.MAPIT_SENDFILE_HEADER = ''
+        settings.MAPIT_POLYGON_CACHE_URL = ''
+        self.factory = RequestFactory()
+        self.area = self.make_area('Square', square(0, 0, 10))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        for name, value in self.original_settings.items():
+            setattr(settings, name, value)
+        super(PolygonCacheTest, self).tearDown()
+
+    def files(self):
+        return [ f for d, dirs, files in os.walk(self.dir) for f in files ]
+
+    def test_output_is_stored_gzipped(self):
+        filename = polygoncache.get(self.area, self.generation, 4326, 'wkt', 0)
+        self.assertEqual(gzip.open(filename).read(), polygoncache.render_polygon(self.area, 4326, 'wkt', 0))
+        self.assertEqual(polygoncache.read(filename), polygoncache.render_polygon(self.area, 4326, 'wkt', 0))
+        # JSON and GeoJSON share a file
+        self.assertEqual(polygoncache.get(self.area, self.generation, 4326, 'geojson', 0),
+            polygoncache.get(self.area, self.generation, 4326, 'json', 0))
+
+    def test_area_without_polygons(self):
+        area = self.make_area('Empty')
+        self.assertEqual(polygoncache.get(area, self.generation, 4326, 'wkt', 0), None)
+
+    def test_new_polygons_get_new_files(self):
+        old = polygoncache.get(self.area, self.generation, 4326, 'wkt', 0)
+        self.area.polygons.all().delete()
+        self.area.polygons.create(polygon=square(20, 20, 10))
+        new = polygoncache.get(self.area, self.generation, 4326, 'wkt', 0)
+        self.assertNotEqual(old, new)
+        self.assertEqual(polygoncache.read(new), polygoncache.render_polygon(self.area, 4326, 'wkt', 0))
+
+    def test_least_recently_used_are_swept(self):
+        names = []
+        for i in range(3):
+            name = os.path.join(self.dir, 'file%d' % i)
+            open(name, 'wb').write('x' * 500000)
+            os.utime(name, (i, i))
+            names.append(name)
+        polygoncache.sweep()
+        self.assertFalse(os.path.exists(names[0]))
+        self.assertTrue(os.path.exists(names[2]))
+        self.assertTrue(sum(os.path.getsize(n) for n in names if os.path.exists(n)) <= 1024 * 1024)
+
+    def response(self, **headers):
+        filename = polygoncache.get(self.area, self.generation, 4326, 'wkt', 0)
+        path = headers.pop('path', '/area/%d.wkt' % self.area.id)
+        return polygoncache.response(self.factory.get(path, **headers), filename, 'wkt')
+
+    def test_gzip_response(self):
+        response = self.response(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response.streaming)
+        self.assertTrue('Accept-Encoding' in response['Vary'])
+
+    def test_plain_response(self):
+        expected = polygoncache.render_polygon(self.area, 4326, 'wkt', 0)
+        for headers in ({}, { 'HTTP_ACCEPT_ENCODING': 'gzip;q=0' },
+                { 'HTTP_ACCEPT_ENCODING': 'gzip', 'path': '/area/%d.wkt?callback=f' % self.area.id }):
+            response = self.response(**headers)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response.content, expected)
+
+    def test_sendfile_response(self):
+        settings.MAPIT_SENDFILE_HEADER = 'X-Accel-Redirect'
+        settings.MAPIT_POLYGON_CACHE_URL = '/polygons/'
+        response = self.response(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/polygons/%d/' % self.area.id))
+        self.assertEqual(''.join(response), '')
+
+    def test_view_only_caches_standard_tolerances(self):
+        self.client.get('/area/%d.kml' % self.area.id, { 'simplify_tolerance': '0.0001234' })
+        self.assertEqual(self.files(), [])
+        response = self.client.get('/area/%d.kml' % self.area.id, { 'simplify_tolerance': '0.001' })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.files()), 1)
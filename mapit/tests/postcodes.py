@@ -0,0 +1,154 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
+from django.utils.unittest import skipUnless
+
+from mapit import utils
+from mapit.countries import gb, no
+from mapit.models import Area, Postcode, PostcodeArea
+from mapit.views import postcodes as postcode_views
+from mapit.management.commands.utils import PostcodeCommand
+from mapit.tests.base import AreaTestMixin, square, point
+
+VALID = [
+    'SW1A1AA', 'EC1A1BB', 'W1A0AX', 'M11AE', 'B338TH', 'CR26XH', 'DN551PT',
+    'BT11AA', 'N16XE', 'E142HB', 'ZZ99ZZ', 'GIR0AA', 'STHL1ZZ',
+]
+INVALID = [
+    '', 'SW1A', '1AA', 'SW1A1AAA', 'QA11AA', 'AI11AA', 'A1Z1AA', 'SW1A1CA',
+    'SW1A 1AA', 'sw1a1aa', 'ZZ99ZX', 'W1A0AI', 'AA0A1AA',
+]
+PARTIAL_VALID = [ 'SW1A', 'EC1A', 'W1A', 'M1', 'B33', 'CR2', 'DN55', 'ZZ9' ]
+PARTIAL_INVALID = [ '', 'SW1A1AA', 'Q1', '11', 'A1Z', 'W1I' ]
+
+class GBPostcodeTest(TestCase):
+    def test_valid(self):
+        for pc in VALID:
+            self.assertTrue(gb.is_valid_postcode(pc), pc)
+
+    def test_invalid(self):
+        for pc in INVALID:
+            self.assertFalse(gb.is_valid_postcode(pc), pc)
+
+    def test_partial(self):
+        for pc in PARTIAL_VALID:
+            self.assertTrue(gb.is_valid_partial_postcode(pc), pc)
+        for pc in PARTIAL_INVALID:
+            self.assertFalse(gb.is_valid_partial_postcode(pc), pc)
+
+    def test_validate_many(self):
+        postcodes = VALID + INVALID
+        self.assertEqual(gb.validate_many(postcodes), map(gb.is_valid_postcode, postcodes))
+
+class NOPostcodeTest(TestCase):
+    def test_validate_many(self):
+        postcodes = [ '0150', '9999', '015', '01500', 'ABCD', '' ]
+        self.assertEqual(no.validate_many(postcodes), [ True, True, False, False, False, False ])
+        self.assertEqual(no.validate_many(postcodes), map(no.is_valid_postcode, postcodes))
+
+class ValidateManyTest(TestCase):
+    def test_matches_is_valid_postcode(self):
+        # Whatever country is configured, lower case and spaces are ignored
+        postcodes = VALID + INVALID + [ 'sw1a 1aa', ' 0150 ', 'bt1\t1aa' ]
+        self.assertEqual(utils.validate_many(postcodes), map(utils.is_valid_postcode, postcodes))
+
+@skipUnless(settings.MAPIT_COUNTRY == 'GB', 'needs GB postcodes')
+class PostcodesLookupTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(PostcodesLookupTest, self).setUp()
+        self.big = self.make_area('Big', square(0, 0, 10))
+        self.inside = self.make_area('Inside', square(2, 2, 2))
+        self.make_postcode('SW1A1AA', 3, 3)
+        self.make_postcode('EC1A1BB', 8, 8)
+        Postcode.objects.create(postcode='ZZ99ZZ')
+
+    def make_postcode(self, postcode, x, y):
+        location = point(x, y)
+        location.transform(4326)
+        return Postcode.objects.create(postcode=postcode, location=location)
+
+    def lookup(self, postcodes):
+        response = postcode_views.postcodes(RequestFactory().post('/postcodes', { 'postcodes': postcodes }))
+        return simplejson.loads(response.content)
+
+    def single(self, postcode):
+        response = postcode_views.postcode(RequestFactory().get('/postcode/%s' % postcode), postcode)
+        return simplejson.loads(response.content)
+
+    def test_matches_single_lookups(self):
+        out = self.lookup('SW1A 1AA,ec1a1bb\nZZ99ZZ')
+        self.assertEqual(sorted(out), [ 'SW1A 1AA', 'ZZ99ZZ', 'ec1a1bb' ])
+        for given, postcode in (('SW1A 1AA', 'SW1A1AA'), ('ec1a1bb', 'EC1A1BB'), ('ZZ99ZZ', 'ZZ99ZZ')):
+            self.assertEqual(out[given], self.single(postcode))
+        self.assertEqual(sorted(out['SW1A 1AA']['areas']), sorted([ str(self.big.id), str(self.inside.id) ]))
+        self.assertEqual(out['ZZ99ZZ']['areas'], {})
+
+    def test_errors(self):
+        out = self.lookup('BAD;SW1A2AA')
+        self.assertEqual(out['BAD']['code'], 400)
+        self.assertEqual(out['SW1A2AA'], { 'error': 'No Postcode matches the given query.', 'code': 404 })
+        self.assertEqual(postcode_views.postcodes(RequestFactory().get('/postcodes')).status_code, 400)
+        self.assertEqual(postcode_views.postcodes(RequestFactory().post('/postcodes', { 'postcodes': ' , ' })).status_code, 400)
+        too_many = ','.join([ 'SW1A1AA' ] * (postcode_views.MAX_POSTCODES + 1))
+        self.assertEqual(postcode_views.postcodes(RequestFactory().post('/postcodes', { 'postcodes': too_many })).status_code, 400)
+
+class PostcodeAreaTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(PostcodeAreaTest, self).setUp()
+        self.big = self.make_area('Big', square(0, 0, 10))
+        self.inside = self.make_area('Inside', square(2, 2, 2))
+        self.elsewhere = self.make_area('Elsewhere', square(50, 50, 10))
+        self.postcodes = []
+        for postcode, x, y in (('SW1A1AA', 3, 3), ('EC1A1BB', 8, 8), ('W1A0AX', 30, 30)):
+            location = point(x, y)
+            location.transform(4326)
+            self.postcodes.append(Postcode.objects.create(postcode=postcode, location=location))
+        # Postcodes can be put in an area directly, too
+        self.postcodes[2].areas.add(self.elsewhere)
+
+    def areas(self, postcode):
+        return sorted( area.id for area in Area.objects.by_postcode(postcode, self.generation) )
+
+    def test_stored_match_live_lookups(self):
+        live = [ self.areas(pc) for pc in self.postcodes ]
+        self.assertEqual(live, [ sorted([ self.big.id, self.inside.id ]), [ self.big.id ], [ self.elsewhere.id ] ])
+        call_command('find_postcode_areas', generation_id=self.generation.id, commit=True)
+        stored = [
+            sorted(PostcodeArea.objects.filter(postcode=pc, generation=self.generation).values_list('area', flat=True))
+            for pc in self.postcodes
+        ]
+        self.assertEqual(stored, live)
+        self.assertEqual([ self.areas(pc) for pc in self.postcodes ], live)
+
+    def test_stored_are_used(self):
+        call_command('find_postcode_areas', generation_id=self.generation.id, commit=True)
+        PostcodeArea.objects.filter(postcode=self.postcodes[0], area=self.inside).delete()
+        self.assertEqual(self.areas(self.postcodes[0]), [ self.big.id ])
+
+    def test_run_again(self):
+        call_command('find_postcode_areas', generation_id=self.generation.id, commit=True)
+        call_command('find_postcode_areas', generation_id=self.generation.id, commit=True)
+        self.assertEqual(PostcodeArea.objects.filter(generation=self.generation).count(), 4)
+
+class BulkPostcodeImportTest(TestCase):
+    def setUp(self):
+        self.command = PostcodeCommand()
+        self.command.count = { 'total': 0, 'updated': 0, 'unchanged': 0, 'created': 0 }
+        Postcode.objects.create(postcode='AA11AA', location=point(0, 0))
+        Postcode.objects.create(postcode='AA11AB', location=point(0, 0))
+
+    def test_repeated_postcodes_are_counted_once(self):
+        self.command.do_postcodes(iter([
+            ('AA11AA', 400000, 300000), ('AA11AA', 400000, 300000),
+            ('AA11AB', 410000, 300000), ('AA11AB', 410000, 300000),
+            ('AA11AC', 420000, 300000), ('AA11AC', 420000, 300000),
+        ]), 27700)
+        self.assertEqual(self.command.count, { 'total': 3, 'updated': 1, 'unchanged': 1, 'created': 1 })
+        self.assertEqual(Postcode.objects.count(), 3)
+
+    def test_last_location_given_is_used(self):
+        self.command.do_postcodes(iter([ ('AA11AA', 410000, 300000), ('AA11AA', 400000, 300000) ]), 27700)
+        self.assertEqual(self.command.count['unchanged'], 1)
+        self.assertEqual(self.command.count['updated'], 0)
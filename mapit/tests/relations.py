@@ -0,0 +1,78 @@
+from django.test import TestCase
+
+from mapit.models import Area, AreaRelation, AreaRelationsFound, Generation
+from mapit.management.commands.find_area_relations import find_relations
+from mapit.tests.base import AreaTestMixin, square
+
+class AreaRelationTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(AreaRelationTest, self).setUp()
+        self.big = self.make_area('Big', square(0, 0, 10))
+        self.inside = self.make_area('Inside', square(2, 2, 2))
+        self.next_door = self.make_area('Next door', square(10, 0, 10))
+        self.across = self.make_area('Across', square(5, 5, 10))
+
+    def lookups(self):
+        return dict(
+            (relation, sorted(Area.objects.intersect_ids(relation, self.big, generation=self.generation)))
+            for relation in ('touches', 'overlaps', 'covers', 'coveredby')
+        )
+
+    def store_relations(self):
+        ids = [ self.big.id, self.inside.id, self.next_door.id, self.across.id ]
+        for area_id, related_id, relation in find_relations((self.generation.id, ids)):
+            AreaRelation.objects.create(area_id=area_id, related_area_id=related_id,
+                relation=relation, generation=self.generation)
+        for id in ids:
+            AreaRelationsFound.objects.create(area_id=id, generation=self.generation)
+
+    def test_live_lookups(self):
+        self.assertEqual(self.lookups(), {
+            'touches': [ self.next_door.id ],
+            'overlaps': [ self.across.id ],
+            'covers': [],
+            'coveredby': [ self.inside.id ],
+        })
+
+    def test_several_relations_at_once(self):
+        self.assertEqual(
+            sorted(Area.objects.intersect_ids([ 'touches', 'overlaps' ], self.big, generation=self.generation)),
+            sorted([ self.next_door.id, self.across.id ]))
+
+    def test_stored_relations_match_live_lookups(self):
+        live = self.lookups()
+        self.store_relations()
+        self.assertEqual(self.lookups(), live)
+
+    def test_stored_relations_are_used(self):
+        self.store_relations()
+        AreaRelation.objects.filter(area=self.big, related_area=self.next_door).delete()
+        self.assertEqual(Area.objects.intersect_ids('touches', self.big, generation=self.generation), [])
+
+    def test_area_without_any_relations_is_not_looked_up_live(self):
+        alone = self.make_area('Alone', square(50, 50, 10))
+        # Were it looked up live, it would be found to touch this; changing
+        # polygons forgets found relations, so it is made first
+        self.make_area('Next to alone', square(60, 50, 10))
+        self.store_relations()
+        AreaRelationsFound.objects.create(area=alone, generation=self.generation)
+        self.assertEqual(Area.objects.intersect_ids('touches', alone, generation=self.generation), [])
+
+    def test_changed_polygons_forget_found_relations(self):
+        self.store_relations()
+        self.assertEqual(AreaRelationsFound.objects.filter(generation=self.generation).count(), 4)
+        self.next_door.polygons.all().delete()
+        self.next_door.polygons.create(polygon=square(20, 0, 10))
+        self.assertEqual(AreaRelationsFound.objects.filter(generation=self.generation).count(), 0)
+        self.assertEqual(Area.objects.intersect_ids('touches', self.big, generation=self.generation), [])
+
+    def test_area_without_stored_relations_is_looked_up_live(self):
+        self.store_relations()
+        later = self.make_area('Later', square(-10, 0, 10))
+        self.assertEqual(Area.objects.intersect_ids('touches', later, generation=self.generation), [ self.big.id ])
+
+    def test_area_outside_generation_is_looked_up_live(self):
+        self.store_relations()
+        other = Generation.objects.create(active=False, description='Other generation')
+        outside = self.make_area('Outside', square(20, 0, 10), generation=other)
+        self.assertEqual(Area.objects.intersect_ids('touches', outside, generation=self.generation), [ self.next_door.id ])
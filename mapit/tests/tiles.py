@@ -0,0 +1,54 @@
+from django.core.cache import get_cache
+from django.test import TestCase
+
+from mapit import tiles
+from mapit.models import Generation
+from mapit.management.commands.generate_tiles import Command as GenerateTiles
+from mapit.tests.base import AreaTestMixin, square
+
+class TileCacheTest(AreaTestMixin, TestCase):
+    def setUp(self):
+        super(TileCacheTest, self).setUp()
+        self.original_cache = tiles.cache
+        tiles.cache = get_cache('locmem://')
+        tiles.cache.clear()
+        self.original_render_tile = tiles.render_tile
+        self.rendered = 0
+        def render_tile(*args):
+            self.rendered += 1
+            return self.original_render_tile(*args)
+        tiles.render_tile = render_tile
+
+        self.area = self.make_area('Square', square(0, 0, 10))
+        xs, ys = tiles.tile_range(8, GenerateTiles().extent('TST', self.generation))
+        self.tile = (8, xs[0], ys[0])
+
+    def tearDown(self):
+        tiles.cache = self.original_cache
+        tiles.render_tile = self.original_render_tile
+        super(TileCacheTest, self).tearDown()
+
+    def get_tile(self):
+        return tiles.get_tile('TST', Generation.objects.current(), *self.tile)
+
+    def test_cached(self):
+        tile = self.get_tile()
+        self.assertTrue(tile)
+        self.assertEqual(self.get_tile(), tile)
+        self.assertEqual(self.rendered, 1)
+
+    def test_new_polygons(self):
+        tile = self.get_tile()
+        for polygon in self.area.polygons.all():
+            polygon.delete()
+        self.area.polygons.create(polygon=square(2, 2, 5))
+        self.assertNotEqual(self.get_tile(), tile)
+        self.assertEqual(self.rendered, 2)
+
+    def test_new_generation(self):
+        self.get_tile()
+        new = Generation.objects.create(active=True, description='New generation')
+        self.area.generation_high = new
+        self.area.save()
+        self.get_tile()
+        self.assertEqual(self.rendered, 2)
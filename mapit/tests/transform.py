@@ -0,0 +1,31 @@
+from django.test import TestCase
+
+from mapit.transform import compare_with_database, transform_points
+from mapit.tests.base import AreaTestMixin, square
+
+# Some points across Great Britain and Ireland, in WGS84
+POINTS = [ (-0.1276, 51.5072), (-3.1883, 55.9533), (-5.9301, 54.5973), (-1.8904, 52.4862), (-6.2603, 53.3498) ]
+
+class TransformTest(TestCase):
+    def test_matches_database(self):
+        for srid in (27700, 29902):
+            self.assertTrue(compare_with_database(POINTS, 4326, srid) <= 0.001, srid)
+
+    def test_round_trip(self):
+        grid = transform_points(POINTS, 4326, 27700)
+        for (x1, y1), (x2, y2) in zip(POINTS, transform_points(grid, 27700, 4326)):
+            self.assertAlmostEqual(x1, x2, 7)
+            self.assertAlmostEqual(y1, y2, 7)
+
+class CollectPolygonsTest(AreaTestMixin, TestCase):
+    def test_matches_geos_transform(self):
+        # Polygon outputs must be just what GEOSGeometry.transform gave
+        area = self.make_area('Square', square(0, 0, 10))
+        for srid in (4326, 27700, 29902):
+            expected = area.polygons.all()[0].polygon
+            expected.transform(srid)
+            polygon = area.collect_polygons(srid)
+            self.assertEqual(polygon.srid, srid)
+            for (x1, y1), (x2, y2) in zip(expected.coords[0], polygon.coords[0]):
+                self.assertAlmostEqual(x1, x2, 9)
+                self.assertAlmostEqual(y1, y2, 9)
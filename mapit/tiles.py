@@ -0,0 +1,245 @@
+# Mapbox Vector Tiles of the current generation's areas of a type, so that a
+# map can draw lots of boundaries from a few small, cacheable tiles rather
+# than fetching every area's whole polygon. The clipping and simplifying is
+# done by PostGIS; the encoding (version 2 of the spec, see
+# https://github.com/mapbox/vector-tile-spec) is done here, as it is only a
+# few varints. Tiles are kept in the cache, and the generate_tiles command can
+# fill it in advance.
+
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.contrib.gis.geos import GEOSGeometry
+
+# Spherical Mercator, as used by slippy maps
+TILE_SRID = 900913
+HALF_WORLD = 20037508.342789244
+
+# Tile coordinates run from 0 to TILE_EXTENT, and geometry is clipped a little
+# outside that so that edges aren't drawn at tile boundaries
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 20
+
+TILE_CACHE_TIMEOUT = 86400 * 30
+
+# Tiles are cached under their generation and the version stored under this
+# key in the cache, which forget changes whenever polygons are replaced, so
+# that out of date tiles are never served
+TILE_VERSION_KEY = 'mapit-tile-version'
+
+# Below this zoom, a tile is too much of the world for its box to be usefully
+# (or, near the poles and antimeridian, correctly) transformed into the areas'
+# SRID to find candidates by bounding box; every area of the type is tried.
+BOX_FILTER_MIN_ZOOM = 5
+
+# How many pieces each side of the box is cut into before being transformed,
+# so the curved edges it becomes are followed closely enough
+BOX_SEGMENTS = 32
+
+def tile_bounds(z, x, y):
+    """Returns the (min_x, min_y, max_x, max_y) of a tile, in TILE_SRID."""
+    size = 2 * HALF_WORLD / 2**z
+    min_x = -HALF_WORLD + x * size
+    max_y = HALF_WORLD - y * size
+    return (min_x, max_y - size, min_x + size, max_y)
+
+def tile_range(z, extent):
+    """Returns the x and y ranges of the tiles at zoom z covering extent,
+    which is in TILE_SRID."""
+    n = 2**z
+    size = 2 * HALF_WORLD / n
+    def clamp(i):
+        return min(max(int(math.floor(i)), 0), n - 1)
+    min_x, min_y, max_x, max_y = extent
+    return (
+        range(clamp((min_x + HALF_WORLD) / size), clamp((max_x + HALF_WORLD) / size) + 1),
+        range(clamp((HALF_WORLD - max_y) / size), clamp((HALF_WORLD - min_y) / size) + 1),
+    )
+
+def tile_version():
+    version = cache.get(TILE_VERSION_KEY)
+    if version is None:
+        # Started from the time, so as not to be an old version again if the
+        # key has gone from the cache
+        cache.add(TILE_VERSION_KEY, int(time.time() * 1000), TILE_CACHE_TIMEOUT)
+        version = cache.get(TILE_VERSION_KEY)
+    return version
+
+def forget():
+    """Makes every cached tile out of date."""
+    try:
+        cache.incr(TILE_VERSION_KEY)
+    except ValueError:
+        tile_version()
+
+def get_tile(type, generation, z, x, y):
+    """Returns the encoded tile of areas of type (a code) in generation,
+    from the cache if possible."""
+    key = 'mapit-tile:%s:%d:%s:%d:%d:%d' % (tile_version(), generation.id, type, z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = render_tile(type, generation, z, x, y)
+        cache.set(key, tile, TILE_CACHE_TIMEOUT)
+    return tile
+
+def render_tile(type, generation, z, x, y):
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    scale = TILE_EXTENT / (max_x - min_x)
+    buffer = TILE_BUFFER / scale
+    def clamp(n):
+        return min(max(n, -HALF_WORLD), HALF_WORLD)
+    box = 'ST_SetSRID(ST_MakeBox2D(ST_MakePoint(%s, %s), ST_MakePoint(%s, %s))::geometry, %d)' % (
+        clamp(min_x - buffer), clamp(min_y - buffer), clamp(max_x + buffer), clamp(max_y + buffer), TILE_SRID)
+    if z >= BOX_FILTER_MIN_ZOOM:
+        # Transforming only the box's corners could leave out some of what it
+        # covers, so its edges are cut up first
+        box_filter = 'AND mapit_geometry.polygon && ST_Transform(ST_Segmentize(%s, %s), %d)' % (
+            box, (max_x - min_x + 2 * buffer) / BOX_SEGMENTS, settings.MAPIT_AREA_SRID)
+    else:
+        box_filter = ''
+
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT mapit_area.id, mapit_area.name, ST_AsBinary(ST_SimplifyPreserveTopology(
+            ST_Intersection(ST_Transform(mapit_geometry.polygon, %(tile_srid)d), %(box)s), %%s
+        ))
+        FROM mapit_area, mapit_type, mapit_geometry
+        WHERE mapit_type.id = mapit_area.type_id AND mapit_type.code = %%s
+            AND mapit_area.generation_low_id <= %%s AND mapit_area.generation_high_id >= %%s
+            AND mapit_geometry.area_id = mapit_area.id
+            %(box_filter)s
+        ORDER BY mapit_area.id
+    ''' % { 'box': box, 'tile_srid': TILE_SRID, 'box_filter': box_filter },
+        [ 1 / scale, type, generation.id, generation.id ])
+
+    # An area may have more than one polygon, but is one feature, so the
+    # position its commands have got to has to be kept between them
+    features = []
+    for area_id, name, wkb in cursor.fetchall():
+        if wkb is None:
+            continue
+        if not features or features[-1][0] != area_id:
+            features.append( (area_id, name, []) )
+            position = [ 0, 0 ]
+        geometry = GEOSGeometry(wkb)
+        features[-1][2].extend( encode_polygons(geometry, min_x, max_y, scale, position) )
+    features = [ f for f in features if f[2] ]
+    if not features:
+        return ''
+    return encode_tile(type, features)
+
+# Protocol buffer encoding
+
+def varint(n):
+    out = []
+    while n > 0x7f:
+        out.append(chr((n & 0x7f) | 0x80))
+        n >>= 7
+    out.append(chr(n))
+    return ''.join(out)
+
+def zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+def field(number, value):
+    """A length delimited field, such as a string or sub-message."""
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+def varint_field(number, value):
+    return varint(number << 3) + varint(value)
+
+def packed_field(number, values):
+    return field(number, ''.join(map(varint, values)))
+
+def encode_tile(type, features):
+    """Returns a tile with one layer, named after the area type, of the given
+    (area ID, name, geometry commands) features. Each feature has its ID and
+    name as attributes."""
+    keys = [ 'id', 'name' ]
+    values = []
+    value_index = {}
+    def value(v, encoded):
+        if v not in value_index:
+            value_index[v] = len(values)
+            values.append(encoded)
+        return value_index[v]
+
+    layer = [ varint_field(15, 2), field(1, type) ]
+    for area_id, name, commands in features:
+        tags = [
+            0, value(area_id, varint_field(5, area_id)),
+            1, value(name, field(1, name)),
+        ]
+        layer.append(field(2, ''.join([
+            varint_field(1, area_id),
+            packed_field(2, tags),
+            varint_field(3, 3), # POLYGON
+            packed_field(4, commands),
+        ])))
+    layer.extend( field(3, k) for k in keys )
+    layer.extend( field(4, v) for v in values )
+    layer.append(varint_field(5, TILE_EXTENT))
+    return field(3, ''.join(layer))
+
+# Geometry encoding
+
+def polygons(geometry):
+    """Yields the polygons in a geometry, ignoring any points or lines that
+    clipping has left behind."""
+    if geometry.geom_type == 'Polygon':
+        yield geometry
+    elif geometry.geom_type in ('MultiPolygon', 'GeometryCollection'):
+        for g in geometry:
+            for p in polygons(g):
+                yield p
+
+def ring_points(ring, min_x, max_y, scale):
+    """Returns a ring's points in tile coordinates (with y pointing down), as
+    a list without repeated points or the closing point, and its area."""
+    points = []
+    for x, y in ring.coords:
+        point = ( int(round((x - min_x) * scale)), int(round((max_y - y) * scale)) )
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    area = 0
+    for i in range(len(points)):
+        x1, y1 = points[i-1]
+        x2, y2 = points[i]
+        area += x1 * y2 - x2 * y1
+    return points, area
+
+def encode_polygons(geometry, min_x, max_y, scale, cursor):
+    """Returns the geometry commands for the polygons in geometry, continuing
+    from cursor, an [x, y] list which is updated. Exterior rings are wound so
+    they have positive area in tile coordinates, interior rings negative."""
+    commands = []
+    def ring(points):
+        commands.append(1 | 1 << 3) # MoveTo
+        for i, (x, y) in enumerate(points):
+            if i == 1:
+                commands.append(2 | (len(points) - 1) << 3) # LineTo
+            commands.extend( (zigzag(x - cursor[0]), zigzag(y - cursor[1])) )
+            cursor[:] = [ x, y ]
+        commands.append(7 | 1 << 3) # ClosePath
+
+    for polygon in polygons(geometry):
+        points, area = ring_points(polygon[0], min_x, max_y, scale)
+        if len(points) < 3 or area == 0:
+            continue
+        if area < 0: points.reverse()
+        ring(points)
+        for interior in polygon[1:]:
+            points, area = ring_points(interior, min_x, max_y, scale)
+            if len(points) < 3 or area == 0:
+                continue
+            if area > 0: points.reverse()
+            ring(points)
+    return commands
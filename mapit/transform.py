@@ -0,0 +1,96 @@
+# Coordinate transformations done in process, rather than by asking the
+# database to ST_Transform each point. The projections are made from the
+# proj4 definitions in the database's spatial_ref_sys, not GDAL's own files,
+# as those are the ones that have been checked to have the right datums (see
+# the README; e.g. Irish Grid needs +datum=ire65), so the results are the same
+# as the database would give; compare_with_database (and the check_transforms
+# command) checks that they are. Anything that has always used GDAL's own
+# definitions can ask for those instead. Each transformation is made once per
+# process. Lots of points are transformed with one call to GDAL, using NumPy
+# arrays if NumPy is installed.
+
+from ctypes import c_double, c_int, c_void_p, POINTER
+
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
+from django.contrib.gis.geos import GEOSGeometry, MultiPoint, Point
+from django.contrib.gis.gdal.libgdal import lgdal
+from django.db import connection
+from psycopg2 import Binary
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_transforms = {}
+
+# Indexing the library gives a function object of our own, so that setting its
+# types doesn't change them for the rest of GeoDjango
+_oct_transform = lgdal['OCTTransform']
+_oct_transform.argtypes = [ c_void_p, c_int, POINTER(c_double), POINTER(c_double), POINTER(c_double) ]
+_oct_transform.restype = c_int
+
+def spatial_reference(srid, database=True):
+    """Returns the SpatialReference of srid, as defined in the database's
+    spatial_ref_sys, or GDAL's own if database is False."""
+    if not database:
+        return SpatialReference(srid)
+    cursor = connection.cursor()
+    cursor.execute('SELECT proj4text FROM spatial_ref_sys WHERE srid = %s', [ srid ])
+    row = cursor.fetchone()
+    if not row:
+        raise ValueError, "Unknown SRID %s" % srid
+    return SpatialReference(str(row[0]).strip())
+
+def get_transform(from_srid, to_srid, database=True):
+    """Returns the CoordTransform from one SRID to another."""
+    key = (from_srid, to_srid, database)
+    if key not in _transforms:
+        _transforms[key] = CoordTransform(spatial_reference(from_srid, database), spatial_reference(to_srid, database))
+    return _transforms[key]
+
+def transform(geometry, srid, database=True):
+    """Transforms a GEOS geometry to srid, in place."""
+    if geometry.srid == srid: return
+    geometry.transform(get_transform(geometry.srid, srid, database))
+    geometry.srid = srid
+
+def transform_coords(xs, ys, from_srid, to_srid, database=True):
+    """Transforms the points with the given sequences of x and y coordinates
+    from one SRID to another, with one call to GDAL. Returns the new x and y
+    coordinates, as NumPy arrays if NumPy is installed, otherwise lists."""
+    n = len(xs)
+    if numpy is not None:
+        xs = numpy.array(xs, dtype=numpy.float64)
+        ys = numpy.array(ys, dtype=numpy.float64)
+        if from_srid == to_srid or not n: return xs, ys
+        zs = numpy.zeros(n)
+        pointers = [ a.ctypes.data_as(POINTER(c_double)) for a in (xs, ys, zs) ]
+    else:
+        if from_srid == to_srid or not n: return list(xs), list(ys)
+        xs, ys, zs = (c_double * n)(*xs), (c_double * n)(*ys), (c_double * n)()
+        pointers = [ xs, ys, zs ]
+    if not _oct_transform(get_transform(from_srid, to_srid, database).ptr, n, *pointers):
+        raise ValueError, "Could not transform points from %s to %s" % (from_srid, to_srid)
+    if numpy is not None:
+        return xs, ys
+    return list(xs), list(ys)
+
+def transform_points(points, from_srid, to_srid, database=True):
+    """Transforms a list of (x, y) points from one SRID to another, all at
+    once, returning a list of (x, y) tuples."""
+    if not points: return []
+    xs, ys = transform_coords([ p[0] for p in points ], [ p[1] for p in points ], from_srid, to_srid, database)
+    return zip(xs, ys)
+
+def compare_with_database(points, from_srid, to_srid):
+    """Transforms a list of (x, y) points both here and with ST_Transform,
+    and returns the largest distance between the two results for any point,
+    in the units of to_srid."""
+    if not points: return 0
+    ours = transform_points(points, from_srid, to_srid)
+    cursor = connection.cursor()
+    cursor.execute('SELECT ST_AsBinary(ST_Transform(ST_GeomFromWKB(%s, %s), %s))', [
+        Binary(MultiPoint([ Point(p) for p in points ]).wkb), from_srid, to_srid ])
+    theirs = GEOSGeometry(str(cursor.fetchone()[0])).coords
+    return max( ((x1 - x2)**2 + (y1 - y2)**2) ** 0.5 for (x1, y1), (x2, y2) in zip(ours, theirs) )
@@ -12,6 +12,7 @@ urlpatterns = patterns('',
 
     (r'^postcode/$', 'mapit.views.postcodes.form_submitted'),
     (r'^postcode/(?P<postcode>[A-Za-z0-9 +]+)%s$' % format_end, 'mapit.views.postcodes.postcode'),
+    (r'^postcodes$', 'mapit.views.postcodes.postcodes'),
     (r'^postcode/partial/(?P<postcode>[A-Za-z0-9 ]+)%s$' % format_end, 'mapit.views.postcodes.partial_postcode'),
 
     (r'^area/(?P<area_id>[0-9A-Z]+)%s$' % format_end, 'mapit.views.areas.area'),
@@ -27,14 +28,20 @@ urlpatterns = patterns('',
     (r'^area/(?P<srid>[0-9]+)/(?P<area_id>[0-9]+)\.(?P<format>kml|json|geojson|wkt)$', 'mapit.views.areas.area_polygon'),
 
     (r'^point/(?P<srid>[0-9]+)/(?P<x>[0-9.-]+),(?P<y>[0-9.-]+)(?:/(?P<bb>box))?%s$' % format_end, 'mapit.views.areas.areas_by_point'),
+    (r'^points/(?P<srid>[0-9]+)$', 'mapit.views.areas.areas_by_points'),
     (r'^point/latlon/(?P<lat>[0-9.-]+),(?P<lon>[0-9.-]+)(?:/(?P<bb>box))?%s$' % format_end, 'mapit.views.areas.areas_by_point_latlon'),
     (r'^point/osgb/(?P<e>[0-9.-]+),(?P<n>[0-9.-]+)(?:/(?P<bb>box))?%s$' % format_end, 'mapit.views.areas.areas_by_point_osgb'),
 
     (r'^nearest/(?P<srid>[0-9]+)/(?P<x>[0-9.-]+),(?P<y>[0-9.-]+)%s$' % format_end, 'mapit.views.postcodes.nearest'),
 
+    (r'^areas/autocomplete$', 'mapit.views.areas.areas_autocomplete'),
     (r'^areas/(?P<area_ids>[0-9,]*[0-9]+)%s$' % format_end, 'mapit.views.areas.areas'),
     (r'^areas/(?P<area_ids>[0-9,]*[0-9]+)/geometry$', 'mapit.views.areas.areas_geometry'),
     (r'^areas/(?P<type>[A-Z,]*[A-Z]+)%s$' % format_end, 'mapit.views.areas.areas_by_type'),
     (r'^areas/(?P<name>.+?)%s$' % format_end, 'mapit.views.areas.areas_by_name'),
     (r'^areas$', 'mapit.views.areas.deal_with_POST', { 'call': 'areas' }),
+
+    (r'^tiles/(?P<type>[A-Z0-9]+)/(?P<z>[0-9]+)/(?P<x>[0-9]+)/(?P<y>[0-9]+)\.mvt$', 'mapit.views.tiles.tile'),
+
+    (r'^cache/stats$', 'mapit.views.cache.cache_stats'),
 )
@@ -1,19 +1,38 @@
 import re
+import unicodedata
 from django.conf import settings
 
 from mapit import countries
 
+WHITESPACE = re.compile('\s+')
+
 def is_valid_postcode(pc):
-    pc = re.sub('\s+', '', pc.upper())
+    pc = WHITESPACE.sub('', pc.upper())
 
     if hasattr(countries, 'is_valid_postcode'):
         return countries.is_valid_postcode(pc)
     return False
 
 def is_valid_partial_postcode(pc):
-    pc = re.sub('\s+', '', pc.upper())
+    pc = WHITESPACE.sub('', pc.upper())
 
     if hasattr(countries, 'is_valid_partial_postcode'):
         return countries.is_valid_partial_postcode(pc)
     return False
 
+def validate_many(postcodes):
+    """Returns a list of whether each of the given postcodes is valid, as
+    is_valid_postcode would, for checking lots at once."""
+    postcodes = [ WHITESPACE.sub('', pc.upper()) for pc in postcodes ]
+    if hasattr(countries, 'validate_many'):
+        return countries.validate_many(postcodes)
+    if hasattr(countries, 'is_valid_postcode'):
+        return map(countries.is_valid_postcode, postcodes)
+    return [ False ] * len(postcodes)
+
+def normalise_name(name):
+    """Returns the key a name is searched by: lower case, without accents,
+    and with each run of punctuation and spaces made a single space."""
+    name = unicodedata.normalize('NFKD', unicode(name))
+    name = u''.join(c for c in name if not unicodedata.combining(c))
+    return re.sub('(?u)[\W_]+', ' ', name.lower()).strip()[:100]
@@ -14,9 +14,12 @@ from django.core.urlresolvers import resolve, reverse
 from django.db.models import Q
 from django.conf import settings
 
-from mapit.models import Area, Generation, Geometry, Code
-from mapit.shortcuts import output_json, output_html, render, get_object_or_404, output_error, set_timeout
+from mapit.models import Area, Generation, Geometry, GeometrySummary, Code, simplify_srids, simplify_tolerances
+from mapit.shortcuts import output_json, output_json_stream, output_html, render, get_object_or_404, output_error, set_timeout
 from mapit.ratelimitcache import ratelimit
+from mapit.pointindex import get_index
+from mapit import nameindex
+from mapit import polygoncache
 from mapit import countries
 
 def generations(request):
@@ -26,8 +29,9 @@ def generations(request):
 @ratelimit(minutes=3, requests=100)
 def area(request, area_id, format='json'):
     if hasattr(countries, 'area_code_lookup'):
-        resp = countries.area_code_lookup(area_id, format)
-        if resp: return resp
+        resp = countries.area_code_lookup(area_id, format, inline=request.GET.get('inline'))
+        if isinstance(resp, HttpResponse): return resp
+        if resp: area_id = str(resp)
 
     if not re.match('\d+$', area_id):
         return output_error(format, 'Bad area ID specified', 400)
@@ -45,8 +49,9 @@ def area(request, area_id, format='json'):
 @ratelimit(minutes=3, requests=100)
 def area_polygon(request, srid='', area_id='', format='kml'):
     if not srid and hasattr(countries, 'area_code_lookup'):
-        resp = countries.area_code_lookup(area_id, format)
-        if resp: return resp
+        resp = countries.area_code_lookup(area_id, format, inline=request.GET.get('inline'))
+        if isinstance(resp, HttpResponse): return resp
+        if resp: area_id = str(resp)
 
     if not re.match('\d+$', area_id):
         return output_error(format, 'Bad area ID specified', 400)
@@ -57,40 +62,27 @@ def area_polygon(request, srid='', area_id='', format='kml'):
 
     area = get_object_or_404(Area, id=area_id)
     if isinstance(area, HttpResponse): return area
-    all_areas = area.polygons.all()
-    if len(all_areas) > 1:
-        all_areas = all_areas.collect()
-    elif len(all_areas) == 1:
-        all_areas = all_areas[0].polygon
-    else:
-        return output_json({ 'error': 'No polygons found' }, code=404)
-    if srid != settings.MAPIT_AREA_SRID:
-        all_areas.transform(srid)
 
     try:
         simplify_tolerance = float(request.GET.get('simplify_tolerance', 0))
     except:
         return output_error(format, 'Badly specified tolerance', 400)
-    if simplify_tolerance:
-        all_areas = all_areas.simplify(simplify_tolerance)
-
-    if format=='kml':
-        out = '''<?xml version="1.0" encoding="UTF-8"?>
-<kml xmlns="http://www.opengis.net/kml/2.2">
-    <Placemark>
-        <name>%s</name>
-        %s
-    </Placemark>
-</kml>''' % (area.name, all_areas.kml)
-        content_type = 'application/vnd.google-earth.kml+xml'
-    elif format in ('json', 'geojson'):
-        out = all_areas.json
-        content_type = 'application/json'
-    elif format=='wkt':
-        out = all_areas.wkt
-        content_type = 'text/plain'
-    return HttpResponse(out, content_type='%s; charset=utf-8' % content_type)
-    
+
+    # Only the standard SRIDs and tolerances are cached, so that the number
+    # of files is bounded whatever is asked for
+    generation = Generation.objects.current()
+    cacheable = srid in simplify_srids() and (simplify_tolerance == 0 or simplify_tolerance in simplify_tolerances(srid))
+    if polygoncache.cache_dir() and generation and cacheable:
+        filename = polygoncache.get(area, generation, srid, format, simplify_tolerance)
+        if not filename:
+            return output_json({ 'error': 'No polygons found' }, code=404)
+        return polygoncache.response(request, filename, format)
+
+    out = polygoncache.render_polygon(area, srid, format, simplify_tolerance)
+    if out is None:
+        return output_json({ 'error': 'No polygons found' }, code=404)
+    return HttpResponse(out, content_type='%s; charset=utf-8' % polygoncache.CONTENT_TYPES[format])
+
 @ratelimit(minutes=3, requests=100)
 def area_children(request, area_id, format='json'):
     area = get_object_or_404(Area, format=format, id=area_id)
@@ -108,10 +100,10 @@ def area_children(request, area_id, format='json'):
     elif type:
         args['type__code'] = type
 
-    children = add_codes(area.children.filter(**args))
+    children = area.children.filter(**args).select_related('type', 'country')
 
-    if format == 'html': return output_html(request, 'Children of %s' % area.name, children)
-    return output_json( dict( (child.id, child.as_dict() ) for child in children ) )
+    if format == 'html': return output_html(request, 'Children of %s' % area.name, add_codes(children))
+    return output_json_stream( (child.id, child.as_dict()) for child in iter_with_codes(children) )
 
 def area_intersect(query_type, title, request, area_id, format):
     area = get_object_or_404(Area, format=format, id=area_id)
@@ -120,30 +112,17 @@ def area_intersect(query_type, title, request, area_id, format):
     if not area.polygons.count():
         return output_error(format, 'No polygons found', 404)
 
-    generation = Generation.objects.current()
-    args = {
-        'generation_low__lte': generation,
-        'generation_high__gte': generation,
-    }
-
     type = request.REQUEST.get('type', '')
-    if ',' in type:
-        args['type__code__in'] = type.split(',')
-    elif type:
-        args['type__code'] = type
+    if type:
+        types = type.split(',')
     elif area.type.code in ('EUR'):
-        args['type__code'] = area.type.code
+        types = [ area.type.code ]
+    else:
+        types = None
 
     set_timeout(format)
-    areas = Area.objects.intersect(query_type, area).exclude(id=area.id).filter(**args).distinct()
-
     try:
-        if format == 'html':
-            return output_html(request,
-                title % ('<a href="%sarea/%d.html">%s</a>' % (reverse('mapit_index'), area.id, area.name)),
-                areas, norobots=True
-            )
-        return output_json( dict( (a.id, a.as_dict() ) for a in areas ) )
+        ids = Area.objects.intersect_ids(query_type, area, types)
     except QueryCanceledError:
         return output_error(format, 'That query was taking too long to compute - try restricting to a specific type, if you weren\'t already doing so.', 500)
     except DatabaseError, e:
@@ -153,6 +132,14 @@ def area_intersect(query_type, title, request, area_id, format):
     except InternalError:
         return output_error(format, 'There was an internal error performing that query.', 500)
 
+    areas = Area.objects.filter(id__in=ids).select_related('type', 'country')
+    if format == 'html':
+        return output_html(request,
+            title % ('<a href="%sarea/%d.html">%s</a>' % (reverse('mapit_index'), area.id, area.name)),
+            add_codes(areas), norobots=True
+        )
+    return output_json_stream( (a.id, a.as_dict()) for a in iter_with_codes(areas) )
+
 @ratelimit(minutes=3, requests=100)
 def area_touches(request, area_id, format='json'):
     return area_intersect('touches', 'Areas touching %s', request, area_id, format)
@@ -173,22 +160,37 @@ def area_coverlaps(request, area_id, format='json'):
 def area_covered(request, area_id, format='json'):
     return area_intersect('covers', 'Areas that cover %s', request, area_id, format)
 
+# Fetches the codes of all the given areas at once, rather than each
+# area.as_dict() doing it. List views should also select_related('type',
+# 'country') so that as_dict() needn't look those up for each area either.
 def add_codes(areas):
-    codes = Code.objects.filter(area__in=areas)
+    areas = list(areas)
+    codes = Code.objects.filter(area__in=[ area.id for area in areas ]).select_related('type')
     lookup = {}
     for code in codes:
         lookup.setdefault(code.area_id, []).append(code)
     for area in areas:
-        if area.id in lookup:
-            area.code_list = lookup[area.id]
+        area.code_list = lookup.get(area.id, [])
     return areas
 
+# Like add_codes, but for a large queryset, which is fetched a chunk of areas
+# at a time, in ID order, each chunk being the next chunk_size areas after the
+# last one's ID, so that only one chunk is ever in memory. (iterator() isn't
+# enough, as psycopg2 fetches every row before the first is used.)
+def iter_with_codes(areas, chunk_size=1000):
+    areas = areas.order_by('id')
+    chunk = add_codes(areas[:chunk_size])
+    while chunk:
+        for area in chunk: yield area
+        if len(chunk) < chunk_size: break
+        chunk = add_codes(areas.filter(id__gt=chunk[-1].id)[:chunk_size])
+
 @ratelimit(minutes=3, requests=100)
 def areas(request, area_ids, format='json'):
     area_ids = area_ids.split(',')
-    areas = add_codes(Area.objects.filter(id__in=area_ids))
-    if format == 'html': return output_html(request, 'Areas ID lookup', areas)
-    return output_json( dict( ( area.id, area.as_dict() ) for area in areas ) )
+    areas = Area.objects.filter(id__in=area_ids).select_related('type', 'country')
+    if format == 'html': return output_html(request, 'Areas ID lookup', add_codes(areas))
+    return output_json_stream( (area.id, area.as_dict()) for area in iter_with_codes(areas) )
 
 @ratelimit(minutes=3, requests=100)
 def areas_by_type(request, type, format='json'):
@@ -204,15 +206,13 @@ def areas_by_type(request, type, format='json'):
     elif type:
         args['type__code'] = type
 
-    if min_generation == -1:
-        areas = add_codes(Area.objects.filter(**args))
-    else:
+    if min_generation != -1:
         args['generation_low__lte'] = generation
         args['generation_high__gte'] = min_generation
-        areas = add_codes(Area.objects.filter(**args))
+    areas = Area.objects.filter(**args).select_related('type', 'country')
     if format == 'html':
-        return output_html(request, 'Areas in %s' % type, areas)
-    return output_json( dict( (a.id, a.as_dict() ) for a in areas ) )
+        return output_html(request, 'Areas in %s' % type, add_codes(areas))
+    return output_json_stream( (a.id, a.as_dict()) for a in iter_with_codes(areas) )
 
 @ratelimit(minutes=3, requests=100)
 def areas_by_name(request, name, format='json'):
@@ -223,9 +223,11 @@ def areas_by_name(request, name, format='json'):
         min_generation = generation
 
     type = request.REQUEST.get('type', '')
+    fuzzy = request.REQUEST.get('fuzzy', '')
+    if fuzzy and not Area.objects.fuzzy_search_available():
+        return output_error(format, 'Fuzzy searching is not available', 400)
 
     args = {
-        'name__istartswith': name,
         'generation_low__lte': generation,
         'generation_high__gte': min_generation,
     }
@@ -234,58 +236,80 @@ def areas_by_name(request, name, format='json'):
     elif type:
         args['type__code'] = type
 
-    areas = add_codes(Area.objects.filter(**args))
-    out = dict( ( area.id, area.as_dict() ) for area in areas )
-    if format == 'html': return output_html(request, 'Areas starting with %s' % name, areas)
-    return output_json(out)
+    areas = Area.objects.filter_by_name(name, fuzzy=bool(fuzzy)).filter(**args).select_related('type', 'country')
+    if fuzzy:
+        # Most similar first, so not streamed in ID order; there are only as
+        # many as are similar enough
+        areas = add_codes(areas)
+        if format == 'html': return output_html(request, 'Areas with names like %s' % name, areas)
+        return output_json_stream( (area.id, area.as_dict()) for area in areas )
+
+    if format == 'html': return output_html(request, 'Areas starting with %s' % name, add_codes(areas))
+    return output_json_stream( (area.id, area.as_dict()) for area in iter_with_codes(areas) )
+
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Type-ahead makes a request per keystroke, so is allowed more of them
+@ratelimit(minutes=3, requests=1000)
+def areas_autocomplete(request):
+    index = nameindex.get_index()
+    if not index:
+        return output_json({ 'error': 'No current generation' }, code=404)
+    try:
+        limit = min(int(request.GET.get('limit', 10)), AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return output_json({ 'error': 'Badly specified limit' }, code=400)
+    type = request.GET.get('type', '')
+    types = type and type.split(',') or None
+
+    return output_json([
+        { 'id': id, 'name': name, 'type': type }
+        for id, name, type in index.lookup(request.GET.get('q', ''), types, limit)
+    ])
 
 @ratelimit(minutes=3, requests=100)
 def area_geometry(request, area_id):
-    area = _area_geometry(area_id)
-    if isinstance(area, HttpResponse): return area
-    return output_json(area)
-
-def _area_geometry(area_id):
     area = get_object_or_404(Area, id=area_id)
     if isinstance(area, HttpResponse): return area
-    all_areas = area.polygons.all().collect()
-    if not all_areas:
+    summary = GeometrySummary.objects.for_areas([ area.id ]).get(area.id)
+    if not summary:
         return output_json({ 'error': 'No polygons found' }, code=404)
-    out = {
-        'parts': all_areas.num_geom,
-    }
-    if settings.MAPIT_AREA_SRID != 4326:
-        out['srid_en'] = settings.MAPIT_AREA_SRID
-        out['area'] = all_areas.area
-        out['min_e'], out['min_n'], out['max_e'], out['max_n'] = all_areas.extent
-        out['centre_e'], out['centre_n'] = all_areas.centroid
-        all_areas.transform(4326)
-        out['min_lon'], out['min_lat'], out['max_lon'], out['max_lat'] = all_areas.extent
-        out['centre_lon'], out['centre_lat'] = all_areas.centroid
-    else:
-        out['min_lon'], out['min_lat'], out['max_lon'], out['max_lat'] = all_areas.extent
-        out['centre_lon'], out['centre_lat'] = all_areas.centroid
-        if hasattr(countries, 'area_geometry_srid'):
-            srid = countries.area_geometry_srid
-            all_areas.transform(srid)
-            out['srid_en'] = srid
-            out['area'] = all_areas.area
-            out['min_e'], out['min_n'], out['max_e'], out['max_n'] = all_areas.extent
-            out['centre_e'], out['centre_n'] = all_areas.centroid
-    return out
+    return output_json(summary)
 
 @ratelimit(minutes=3, requests=100)
 def areas_geometry(request, area_ids):
-    area_ids = area_ids.split(',')
-    out = dict( (id, _area_geometry(id)) for id in area_ids )
+    area_ids = [ int(id) for id in area_ids.split(',') ]
+    summaries = GeometrySummary.objects.for_areas(area_ids)
+    out = {}
+    for id in area_ids:
+        if id not in summaries:
+            out[id] = { 'error': 'No Area matches the given query.', 'code': 404 }
+        elif summaries[id] is None:
+            out[id] = { 'error': 'No polygons found', 'code': 404 }
+        else:
+            out[id] = summaries[id]
     return output_json(out)
 
-@ratelimit(minutes=3, requests=100)
-def areas_by_point(request, srid, x, y, bb=False, format='json'):
+def point_lookup_args(request):
+    """Returns the type and generation asked for by a point lookup, and the
+    arguments to restrict Areas to them."""
     type = request.REQUEST.get('type', '')
     generation = request.REQUEST.get('generation', Generation.objects.current())
     if not generation: generation = Generation.objects.current()
 
+    args = { 'generation_low__lte': generation, 'generation_high__gte': generation }
+
+    if ',' in type:
+        args['type__code__in'] = type.split(',')
+    elif type:
+        args['type__code'] = type
+
+    return type, generation, args
+
+@ratelimit(minutes=3, requests=100)
+def areas_by_point(request, srid, x, y, bb=False, format='json'):
+    type, generation, args = point_lookup_args(request)
+
     location = Point(float(x), float(y), srid=int(srid))
     gdal.UseExceptions()
     try:
@@ -295,14 +319,11 @@ def areas_by_point(request, srid, x, y, bb=False, format='json'):
 
     method = 'box' if bb and bb != 'polygon' else 'polygon'
 
-    args = { 'generation_low__lte': generation, 'generation_high__gte': generation }
-
-    if ',' in type:
-        args['type__code__in'] = type.split(',')
-    elif type:
-        args['type__code'] = type
-
-    if type and method == 'polygon':
+    index = get_index(generation) if method == 'polygon' else None
+    if index is not None:
+        args['id__in'] = list(index.areas_at(location))
+        areas = add_codes(Area.objects.filter(**args).select_related('type', 'country'))
+    elif type and method == 'polygon':
         args = dict( ("area__%s" % k, v) for k, v in args.items() )
         # So this is odd. It doesn't matter if you specify types, PostGIS will
         # do the contains test on all the geometries matching the bounding-box
@@ -313,20 +334,58 @@ def areas_by_point(request, srid, x, y, bb=False, format='json'):
         areas = []
         for shape in shapes:
             try:
-                areas.append( Area.objects.get(polygons__id=shape.id, polygons__polygon__contains=location) )
+                areas.append( Area.objects.select_related('type', 'country').get(polygons__id=shape.id, polygons__polygon__contains=location) )
             except:
                 pass
+        areas = add_codes(areas)
     else:
         if method == 'box':
             args['polygons__polygon__bbcontains'] = location
         else:
             geoms = list(Geometry.objects.filter(polygon__contains=location).defer('polygon'))
             args['polygons__in'] = geoms
-        areas = Area.objects.filter(**args)
+        areas = add_codes(Area.objects.filter(**args).select_related('type', 'country'))
 
     if format == 'html': return output_html(request, 'Areas containing (%s,%s)' % (x,y), areas)
     return output_json( dict( (area.id, area.as_dict() ) for area in areas ) )
 
+# The most points that can be looked up in one go
+MAX_POINTS = 10000
+
+@ratelimit(minutes=3, requests=100)
+def areas_by_points(request, srid):
+    """Looks up many points at once. The points are POSTed as x,y pairs
+    separated by semi-colons or whitespace; the output is a list, in the same
+    order, of what /point would return for each point."""
+    if request.method != 'POST':
+        return output_json({ 'error': 'Points must be POSTed' }, code=400)
+
+    try:
+        points = [
+            tuple(map(float, p.split(',')))
+            for p in re.split('[\s;]+', request.POST.get('points', '').strip()) if p
+        ]
+    except ValueError:
+        return output_json({ 'error': 'Badly specified points' }, code=400)
+    if not points or [ p for p in points if len(p) != 2 ]:
+        return output_json({ 'error': 'Badly specified points' }, code=400)
+    if len(points) > MAX_POINTS:
+        return output_json({ 'error': 'Too many points - the limit is %d' % MAX_POINTS }, code=400)
+
+    type, generation, args = point_lookup_args(request)
+
+    index = get_index(generation)
+    if index is not None:
+        matches = [ index.areas_at(Point(x, y, srid=int(srid))) for x, y in points ]
+    else:
+        matches = Area.objects.ids_by_locations(points, srid, generation)
+
+    args['id__in'] = list(set().union(*matches))
+    areas = dict( (area.id, area.as_dict()) for area in add_codes(Area.objects.filter(**args).select_related('type', 'country')) )
+    return output_json([
+        dict( (id, areas[id]) for id in ids if id in areas ) for ids in matches
+    ])
+
 @ratelimit(minutes=3, requests=100)
 def areas_by_point_latlon(request, lat, lon, bb=False, format=''):
     return HttpResponseRedirect("/point/4326/%s,%s%s%s" % (lon, lat, "/box" if bb else '', '.%s' % format if format else ''))
@@ -0,0 +1,18 @@
+import os
+
+from django.views.decorators.cache import never_cache
+
+from mapit.middleware import cache as cache_middleware
+from mapit.shortcuts import output_json
+
+@never_cache
+def cache_stats(request):
+    """The local cache's hit and miss counts so far, in whichever process
+    answers; each process has its own, so this is never cached."""
+    request._cache_update_cache = False
+    page_cache = cache_middleware.page_cache
+    if not isinstance(page_cache, cache_middleware.LocalCache):
+        return output_json({ 'error': 'No local cache is in use' }, code=404)
+    out = page_cache.stats()
+    out['pid'] = os.getpid()
+    return output_json(out)
@@ -12,10 +12,12 @@ from django.shortcuts import render_to_response, redirect
 from django.contrib.gis.geos import Point
 from django.contrib.gis.measure import D
 
-from mapit.models import Postcode, Area, Generation
-from mapit.utils import is_valid_postcode, is_valid_partial_postcode
+from mapit.models import Postcode, PostcodeArea, Area, Generation
+from mapit.utils import is_valid_postcode, is_valid_partial_postcode, validate_many
 from mapit.shortcuts import output_json, get_object_or_404, output_error, set_timeout
 from mapit.ratelimitcache import ratelimit
+from mapit.pointindex import get_index
+from mapit.views.areas import add_codes
 from mapit import countries
 
 # Stupid fixed IDs from old MaPit
@@ -60,7 +62,26 @@ def postcode(request, postcode, format='json'):
     else:
         areas = []
 
-    # Shortcuts
+    shortcuts = postcode_shortcuts(areas)
+
+    # Add manual enclosing areas. 
+    areas = add_codes(list(itertools.chain(
+        areas, Area.objects.filter(id__in=enclosing_area_ids(areas)).select_related('type', 'country')
+    )))
+ 
+    if format == 'html':
+        return render_to_response('mapit/postcode.html', {
+            'postcode': postcode.as_dict(),
+            'areas': areas,
+            'json': '/postcode/',
+        })
+
+    out = postcode.as_dict()
+    out['areas'] = dict( ( area.id, area.as_dict() ) for area in areas )
+    if shortcuts: out['shortcuts'] = shortcuts
+    return output_json(out)
+
+def postcode_shortcuts(areas):
     shortcuts = {}
     for area in areas:
         if area.type.code in ('COP','LBW','LGE','MTW','UTE','UTW'):
@@ -74,24 +95,104 @@ def postcode(request, postcode, format='json'):
             shortcuts.setdefault('council', {})['district'] = area.parent_area_id
         elif area.type.code in ('WMC'): # XXX Also maybe 'EUR', 'NIE', 'SPC', 'SPE', 'WAC', 'WAE', 'OLF', 'OLG', 'OMF', 'OMG'):
             shortcuts[area.type.code] = area.id
+    return shortcuts
 
-    # Add manual enclosing areas. 
+def enclosing_area_ids(areas):
     extra = []
     for area in areas:
         if area.type.code in enclosing_areas.keys():
             extra.extend(enclosing_areas[area.type.code])
-    areas = itertools.chain(areas, Area.objects.filter(id__in=extra))
- 
-    if format == 'html':
-        return render_to_response('mapit/postcode.html', {
-            'postcode': postcode.as_dict(),
-            'areas': areas,
-            'json': '/postcode/',
-        })
+    return extra
+
+# The most postcodes that can be looked up in one go
+MAX_POSTCODES = 5000
+
+@ratelimit(minutes=3, requests=100)
+def postcodes(request):
+    """Looks up many postcodes at once. The postcodes are POSTed separated by
+    commas or new lines; the output is a dictionary, keyed by the postcodes as
+    given, of what /postcode would return for each one (or an error). However
+    many postcodes there are, this takes the same number of queries."""
+    if request.method != 'POST':
+        return output_json({ 'error': 'Postcodes must be POSTed' }, code=400)
+
+    given = [ pc for pc in re.split('[,;\r\n]+', request.POST.get('postcodes', '')) if pc.strip() ]
+    if not given:
+        return bad_request('json', 'No postcodes specified')
+    if len(given) > MAX_POSTCODES:
+        return bad_request('json', 'Too many postcodes - the limit is %d' % MAX_POSTCODES)
+
+    try:
+        generation = int(request.REQUEST['generation'])
+    except:
+        generation = Generation.objects.current()
+
+    out = {}
+    wanted = {}
+    cleaned = [ re.sub('[^A-Z0-9]', '', pc.upper()) for pc in given ]
+    for pc, clean, valid in zip(given, cleaned, validate_many(cleaned)):
+        if valid:
+            wanted.setdefault(clean, []).append(pc)
+        else:
+            out[pc] = { 'error': "Postcode '%s' is not valid." % clean, 'code': 400 }
+
+    found = list(Postcode.objects.filter(postcode__in=wanted.keys()))
+    if hasattr(countries, 'is_special_postcode'):
+        lookup = [ pc for pc in found if not countries.is_special_postcode(pc.postcode) ]
+    else:
+        lookup = found
+
+    # Which areas each postcode is in, precomputed by find_postcode_areas...
+    area_ids = dict( (pc.id, set()) for pc in lookup )
+    for postcode_id, area_id in PostcodeArea.objects.filter(
+        generation=generation, postcode__in=area_ids.keys()
+    ).values_list('postcode_id', 'area_id'):
+        area_ids[postcode_id].add(area_id)
+
+    # ...or if not, by point-in-polygon...
+    remaining = [ pc for pc in lookup if not area_ids[pc.id] ]
+    located = [ pc for pc in remaining if pc.location ]
+    index = get_index(generation)
+    if index is not None:
+        matches = [ index.areas_at(pc.location) for pc in located ]
+    else:
+        matches = Area.objects.ids_by_locations(
+            [ (pc.location[0], pc.location[1]) for pc in located ], 4326, generation)
+    for pc, ids in zip(located, matches):
+        area_ids[pc.id].update(ids)
+
+    # ...and directly stored association
+    for postcode_id, area_id in Postcode.areas.through.objects.filter(
+        postcode__in=[ pc.id for pc in remaining ],
+        area__generation_low__lte=generation, area__generation_high__gte=generation
+    ).values_list('postcode_id', 'area_id'):
+        area_ids[postcode_id].add(area_id)
+
+    # Fetch all the areas in one go, along with any manual enclosing areas
+    all_ids = set(itertools.chain(*area_ids.values()))
+    for ids in enclosing_areas.values():
+        all_ids.update(ids)
+    areas = dict(
+        (area.id, area) for area in add_codes(Area.objects.filter(id__in=all_ids).select_related('type', 'country'))
+    )
+
+    if hasattr(countries, 'prepare_postcodes'):
+        countries.prepare_postcodes(found)
+
+    for pc in found:
+        result = pc.as_dict()
+        pc_areas = [ areas[id] for id in area_ids.get(pc.id, []) if id in areas ]
+        shortcuts = postcode_shortcuts(pc_areas)
+        pc_areas.extend( areas[id] for id in enclosing_area_ids(pc_areas) if id in areas )
+        result['areas'] = dict( ( area.id, area.as_dict() ) for area in pc_areas )
+        if shortcuts: result['shortcuts'] = shortcuts
+        for key in wanted.pop(pc.postcode):
+            out[key] = result
+
+    for keys in wanted.values():
+        for key in keys:
+            out[key] = { 'error': 'No Postcode matches the given query.', 'code': 404 }
 
-    out = postcode.as_dict()
-    out['areas'] = dict( ( area.id, area.as_dict() ) for area in areas )
-    if shortcuts: out['shortcuts'] = shortcuts
     return output_json(out)
 
 @ratelimit(minutes=3, requests=100)
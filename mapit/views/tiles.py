@@ -0,0 +1,21 @@
+from django.http import HttpResponse
+
+from mapit.models import Generation, Type
+from mapit.shortcuts import output_json
+from mapit.ratelimitcache import ratelimit
+from mapit.tiles import get_tile, MAX_ZOOM
+
+@ratelimit(minutes=3, requests=100)
+def tile(request, type, z, x, y):
+    z, x, y = int(z), int(x), int(y)
+    if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+        return output_json({ 'error': 'No such tile' }, code=404)
+    if not Type.objects.filter(code=type).exists():
+        return output_json({ 'error': 'No areas of that type' }, code=404)
+    generation = Generation.objects.current()
+    if not generation:
+        return output_json({ 'error': 'No current generation' }, code=404)
+
+    response = HttpResponse(get_tile(type, generation, z, x, y), content_type='application/x-protobuf')
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
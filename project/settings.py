@@ -35,6 +35,30 @@ MAPIT_COUNTRY = config.get('COUNTRY', '')
 # limiting. Optional.
 MAPIT_RATE_LIMIT = config.get('RATE_LIMIT', [])
 
+# Whether each process should hold the current generation's shapes in memory
+# to answer point lookups, rather than asking PostGIS. Optional, defaults to
+# False.
+MAPIT_POINT_INDEX = config.get('POINT_INDEX', False)
+
+# A directory in which to keep areas' rendered polygons, and how big it may
+# get in megabytes. Optional; polygons are rendered on every request if no
+# directory is set.
+MAPIT_POLYGON_CACHE_DIR = config.get('POLYGON_CACHE_DIR', '')
+MAPIT_POLYGON_CACHE_SIZE = int(config.get('POLYGON_CACHE_SIZE', 1024))
+
+# The header with which the web server can be told to send a cached polygon
+# file itself, e.g. X-Sendfile for Apache's mod_xsendfile, or X-Accel-Redirect
+# for nginx, which also needs the URL at which it serves the cache directory
+# internally. Optional; the files are sent by Django if not set.
+MAPIT_SENDFILE_HEADER = config.get('SENDFILE_HEADER', '')
+MAPIT_POLYGON_CACHE_URL = config.get('POLYGON_CACHE_URL', '')
+
+# How many megabytes of the most used cached pages each process should keep
+# itself, in front of memcached, and for how many seconds at most; see
+# /cache/stats for how well it is doing. Optional, defaults to 0 (off) and 60.
+MAPIT_LOCAL_CACHE_SIZE = int(config.get('LOCAL_CACHE_SIZE', 0))
+MAPIT_LOCAL_CACHE_TIMEOUT = int(config.get('LOCAL_CACHE_TIMEOUT', 60))
+
 # Django settings for mapit project.
 
 DEBUG = config.get('DEBUG', True)
@@ -136,7 +160,7 @@ USE_ETAGS = False
 
 MIDDLEWARE_CLASSES = (
     'mapit.middleware.gzip.GZipMiddleware',
-    'django.middleware.http.ConditionalGetMiddleware',
+    'mapit.middleware.http.ConditionalGetMiddleware',
     'mapit.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',